@@ -1,27 +1,17 @@
-import pandas as pd
-import numpy as np
-from matplotlib import pyplot as plt
-from matplotlib.figure import Figure
-from typing import Any
+from __future__ import annotations
+from typing import TYPE_CHECKING, Any
 from os import path
-from os import listdir
-import re
 
-PATH_TO_FILE = r"C:\Users\wills\Documents\Me\Self-Organisation\Money Stuff\Ins and Outs.xlsx"
+from outputs import output_folder
+from ledger import DEFAULT_WORKBOOK, by_month, load_ledger
 
-january = pd.read_excel(PATH_TO_FILE, "January")
-february = pd.read_excel(PATH_TO_FILE, "February")
+# pandas, numpy and matplotlib get imported where they're used rather than up here,
+# so importing this (like render.py's workers do) doesn't drag pyplot in with it
+if TYPE_CHECKING:
+    import pandas as pd
+    from matplotlib.figure import Figure
 
-def getMaxFileNo(path, filename):
-    directory = listdir(path)
-    max = 0
-    for file in directory:
-        count = 0
-        if filename in file:
-            count = re.search(r"\d+", file).group()
-        if count and int(count) >= max:
-            max = int(count)
-    return max
+PATH_TO_FILE = DEFAULT_WORKBOOK
 
 def plotStem(data: pd.DataFrame, subplot: tuple[Figure, Any], x_axis: str, y_axis: str, exp_root=1, output_path="default"):
 
@@ -49,23 +39,21 @@ def plotStem(data: pd.DataFrame, subplot: tuple[Figure, Any], x_axis: str, y_axi
     elif not y_axis in data.columns:
         raise Exception(y_axis + " not a valid column name")
 
+    import numpy as np
+
     subplot[0].set_figwidth(20)
 
     def nonlinear_transform(y, root: int | float):
         return np.sign(y) * pow(np.abs(y), 1/root)
 
     subplot[1].stem(data[x_axis], data[y_axis].apply(nonlinear_transform, args=(exp_root,)))
-    plt.ylabel(labeldict[y_axis], fontdict={"size": 18})
-    plt.xlabel(labeldict[x_axis], fontdict={"size": 18})
+    subplot[1].set_ylabel(labeldict[y_axis], fontdict={"size": 18})
+    subplot[1].set_xlabel(labeldict[x_axis], fontdict={"size": 18})
     subplot[1].set_title(f"{x_axis} vs {y_axis}")
 
     filename = f"{x_axis}_vs_{y_axis}"
 
-    max = getMaxFileNo(output_path, filename)
-
-    filename = filename + f"_{max + 1}_stem"
-
-    subplot[0].savefig(f"{output_path}/{filename}.png")
+    output_folder(output_path).save(subplot[0], filename, "stem")
 
     return subplot
 
@@ -105,8 +93,12 @@ def plotPie(data: pd.DataFrame, subplot: tuple[Figure, Any], series_name: str, o
 
 
     ### Pieing
+    import numpy as np
+    from matplotlib import colormaps
+    from matplotlib.artist import setp
+
     wedges, texts, autotexts = subplot[1].pie(aggregated.dropna(),
-        colors=plt.get_cmap("Blues")(np.linspace(1, 0.4, len(aggregated))),
+        colors=colormaps["Blues"](np.linspace(1, 0.4, len(aggregated))),
         radius=1.5, center=(3,4),
         wedgeprops={"width": 1, "linewidth": 1, "edgecolor": "white"},
         startangle=90,
@@ -118,7 +110,7 @@ def plotPie(data: pd.DataFrame, subplot: tuple[Figure, Any], series_name: str, o
               loc="center left",
               bbox_to_anchor=(-1, 0.5, 0.5, 0.5))
     
-    plt.setp(autotexts, size=8, weight="bold")
+    setp(autotexts, size=8, weight="bold")
 
     
     ### Naming and saving
@@ -131,17 +123,44 @@ def plotPie(data: pd.DataFrame, subplot: tuple[Figure, Any], series_name: str, o
 
     subplot[1].set_title(format_series_name.replace("_", " "))
 
-    max = getMaxFileNo(output_path, format_series_name)
+    output_folder(output_path).save(subplot[0], format_series_name, "pie")
 
-    format_series_name = format_series_name + f"_{max + 1}"
+    return subplot
+
+# The charts --headless makes for each month (in a folder named after the month):
+# (kind, args, keyword args) for plotStem or plotPie, the same as they'd be called
+# but without the data and subplot
+REPORT_CHARTS = [("pie", ("Time",), {"agg_func": "average", "field": "AmountOut"})]
+
+def main(argv=None):
+    import argparse
+    from render import print_render_times, render_batch
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--headless", metavar="FOLDER", help="save every chart to FOLDER without showing anything")
+    parser.add_argument("--workers", type=int, help="how many processes to render with")
+    parser.add_argument("--workbook", default=PATH_TO_FILE, help="the ledger workbook (or set FINANCES_WORKBOOK)")
+    args = parser.parse_args(argv)
+
+    months = by_month(load_ledger(args.workbook, ["January", "February"]))
+    january = months["January"]
+
+    if args.headless:
+        # each month's charts get a folder of their own, so the charts are named the
+        # same every time whichever worker happens to get to them first
+        jobs = [(kind, month, chart_args, dict(chart_kwargs, output_path=path.join(args.headless, month)))
+                for month in months for kind, chart_args, chart_kwargs in REPORT_CHARTS]
+        print_render_times(render_batch(months, jobs, args.workers))
+    else:
+        from matplotlib import pyplot as plt
 
-    subplot[0].savefig(f"{output_path}/{format_series_name}_pie.png")
+        plotPie(january, 
+                plt.subplots(figsize=(6, 3),
+                            layout="constrained", 
+                            subplot_kw=dict(aspect="equal")), 
+                "Time", 
+                agg_func="average", field="AmountOut")
 
-    return subplot
 
-plotPie(january, 
-        plt.subplots(figsize=(6, 3),
-                    layout="constrained", 
-                    subplot_kw=dict(aspect="equal")), 
-        "Time", 
-        agg_func="average", field="AmountOut")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# Loads the ledger workbook: every month's sheet read in one go (rather than opening
+# and parsing the whole workbook again for each month), stuck together into one
+# frame with a month column. The result gets cached next to the workbook as an .npz,
+# one array per column, which is only used while the workbook hasn't changed since
+# (same mtime and size), so after the first time it loads in milliseconds
+from __future__ import annotations
+import calendar, json, os
+from typing import TYPE_CHECKING
+
+# pandas and numpy are imported by whatever needs them, so importing this just for
+# DEFAULT_WORKBOOK doesn't cost anything
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Where the workbook is, unless it's passed in. Set FINANCES_WORKBOOK to point somewhere else
+DEFAULT_WORKBOOK = os.environ.get("FINANCES_WORKBOOK") or \
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "Ins and Outs.xlsx")
+
+MONTHS = list(calendar.month_name)[1:]
+
+# Bump this whenever what gets cached changes, so old caches get rebuilt
+LEDGER_VERSION = 1
+
+
+def cache_path(workbook) -> str:
+    return os.path.splitext(workbook)[0] + ".ledger.npz"
+
+def _stamp(workbook) -> dict:
+    stat = os.stat(workbook)
+    return {"version": LEDGER_VERSION, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+
+# Every sheet named after a month, in calendar order, as one frame with a month column
+def read_workbook(workbook) -> pd.DataFrame:
+    import pandas as pd
+
+    sheets = pd.read_excel(workbook, sheet_name=None)
+    months = sorted((name for name in sheets if name.strip().title() in MONTHS),
+                    key=lambda name: MONTHS.index(name.strip().title()))
+    if not months:
+        raise ValueError(f"{workbook} has no sheets named after months (has {list(sheets)})")
+
+    ledger = pd.concat([sheets[name] for name in months], keys=[name.strip().title() for name in months],
+                       names=["month", None]).reset_index(level="month").reset_index(drop=True)
+    ledger["month"] = pd.Categorical(ledger["month"], categories=MONTHS, ordered=True)
+    return ledger
+
+
+# Each column as its own array: numbers and dates as they are, the month as codes,
+# and anything else (text, or a mix) as an object array
+def write_cache(ledger: pd.DataFrame, file, stamp: dict):
+    import numpy as np
+    import pandas as pd
+
+    arrays, columns = {}, []
+    for i, (name, column) in enumerate(ledger.items()):
+        key = f"column_{i}"
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            arrays[key] = column.cat.codes.to_numpy()
+            arrays[key + "_categories"] = np.array(column.cat.categories, dtype=object)
+            columns.append({"name": name, "kind": "category", "ordered": bool(column.cat.ordered)})
+        elif column.dtype.kind in "biufcmM":
+            arrays[key] = column.to_numpy()
+            columns.append({"name": name, "kind": "array"})
+        else:
+            arrays[key] = column.to_numpy(dtype=object)
+            columns.append({"name": name, "kind": "object"})
+    arrays["meta"] = np.array(json.dumps({"stamp": stamp, "columns": columns}))
+
+    temp_file = file + ".tmp"
+    with open(temp_file, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(temp_file, file)
+
+# The cached ledger, or None if there isn't one or it's out of date
+def read_cache(file, stamp: dict):
+    import pickle, zipfile
+    import numpy as np
+    import pandas as pd
+
+    try:
+        with np.load(file, allow_pickle=True) as arrays:
+            meta = json.loads(str(arrays["meta"]))
+            if meta["stamp"] != stamp:
+                return None
+            columns = {}
+            for i, column in enumerate(meta["columns"]):
+                values = arrays[f"column_{i}"]
+                if column["kind"] == "category":
+                    values = pd.Categorical.from_codes(values, arrays[f"column_{i}_categories"],
+                                                       ordered=column["ordered"])
+                columns[column["name"]] = values
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile, pickle.UnpicklingError, EOFError):
+        # a cache that's been cut short or damaged just gets rebuilt
+        return None
+    return pd.DataFrame(columns)
+
+
+# The whole ledger, from the cache if the workbook hasn't changed. months=["January",...]
+# just keeps those months
+def load_ledger(workbook=None, months=None, use_cache=True) -> pd.DataFrame:
+    workbook = workbook or DEFAULT_WORKBOOK
+    stamp = _stamp(workbook)
+
+    ledger = read_cache(cache_path(workbook), stamp) if use_cache else None
+    if ledger is None:
+        ledger = read_workbook(workbook)
+        if use_cache:
+            write_cache(ledger, cache_path(workbook), stamp)
+
+    if months:
+        ledger = ledger[ledger["month"].isin(months)].reset_index(drop=True)
+    return ledger
+
+# {month: that month's rows}, for the months that have any
+def by_month(ledger: pd.DataFrame) -> dict:
+    return {month: rows.reset_index(drop=True) for month, rows in ledger.groupby("month", observed=True)}
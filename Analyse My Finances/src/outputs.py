@@ -0,0 +1,61 @@
+# Hands out the next free numbered filename for a chart, like Date_vs_Balance_4_stem.png.
+# This used to be getMaxFileNo, which listed the whole folder and ran a regex over
+# every file on every save (and took the first number it found, so the 1 in
+# "Category1" got mixed up with the chart's number). Now each folder is listed once,
+# the highest number for each (name, kind) is kept, and the next name is claimed by
+# creating the file with O_EXCL, so two processes saving at once can't both get it
+import os, re, threading
+
+RE_NUMBERED = re.compile(r"^(?P<name>.+)_(?P<number>\d+)_(?P<kind>[^_]+)\.(?P<extension>\w+)$")
+
+
+class OutputFolder:
+    def __init__(self, folder):
+        self.folder = folder
+        self._lock = threading.Lock()
+        self._highest = {}
+        os.makedirs(folder, exist_ok=True)
+        for file in os.listdir(folder):
+            match = RE_NUMBERED.match(file)
+            if match:
+                key = (match["name"], match["kind"], match["extension"])
+                self._highest[key] = max(self._highest.get(key, 0), int(match["number"]))
+
+    # Claims the next name for name/kind and gives back its path. The file is there
+    # (empty) by the time this returns, so nothing else can claim it
+    def claim(self, name: str, kind: str, extension="png") -> str:
+        key = (name, kind, extension)
+        with self._lock:
+            number = self._highest.get(key, 0)
+            while True:
+                number += 1
+                path = os.path.join(self.folder, f"{name}_{number}_{kind}.{extension}")
+                try:
+                    os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644))
+                except FileExistsError:
+                    # someone else (another process, most likely) got there first
+                    continue
+                self._highest[key] = number
+                return path
+
+    # Saves figure under the next name for name/kind, giving back where it went
+    def save(self, figure, name: str, kind: str, extension="png", **kwargs) -> str:
+        path = self.claim(name, kind, extension)
+        try:
+            figure.savefig(path, **kwargs)
+        except BaseException:
+            os.remove(path)
+            raise
+        return path
+
+
+# One per folder for the whole process, so each folder only gets listed the once
+_folders = {}
+_folders_lock = threading.Lock()
+
+def output_folder(folder) -> OutputFolder:
+    folder = os.path.abspath(folder)
+    with _folders_lock:
+        if folder not in _folders:
+            _folders[folder] = OutputFolder(folder)
+        return _folders[folder]
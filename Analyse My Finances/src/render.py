@@ -0,0 +1,64 @@
+# Renders a batch of plotStem/plotPie charts straight to files, with no windows, so
+# they can be made by a nightly job. The months' data gets sent to each worker process
+# once (rather than with every chart), and each worker keeps one figure per kind of
+# chart and clears it for the next one instead of building a new figure every time
+import os
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+# Same as the figures analysis.py makes for each kind
+FIGURES = {"stem": {"figsize": (20, 4.8)},
+           "pie": {"figsize": (6, 3), "layout": "constrained"}}
+AXES = {"stem": {}, "pie": {"aspect": "equal"}}
+
+# What this process has to draw from, {name: DataFrame}, and its figures
+_data = {}
+_figures = {}
+
+
+def _start_worker(data: dict):
+    global _data
+    _data = data
+
+def _subplot(kind: str) -> tuple:
+    if kind not in _figures:
+        # a plain Figure draws with Agg, whatever backend pyplot would have picked
+        from matplotlib.figure import Figure
+        figure = Figure(**FIGURES[kind])
+        _figures[kind] = (figure, figure.add_subplot(**AXES[kind]))
+    figure, ax = _figures[kind]
+    ax.clear()
+    return figure, ax
+
+# Draws and saves one (kind, data name, args, kwargs) chart, giving back the job and
+# how long it took
+def render(job: tuple) -> tuple:
+    from analysis import plotPie, plotStem
+
+    kind, name, args, kwargs = job
+    plot = {"stem": plotStem, "pie": plotPie}[kind]
+    started = perf_counter()
+    plot(_data[name], _subplot(kind), *args, **kwargs)
+    return job, perf_counter() - started
+
+
+# Renders every job across workers processes (all the CPUs by default, 1 to do it
+# all in this process). data is {name: DataFrame} for the jobs to refer to
+def render_batch(data: dict, jobs: list, workers=None) -> list:
+    workers = workers or os.cpu_count() or 1
+    for kwargs in (job[3] for job in jobs):
+        if "output_path" in kwargs:
+            os.makedirs(kwargs["output_path"], exist_ok=True)
+
+    if workers == 1 or len(jobs) < 2:
+        _start_worker(data)
+        return [render(job) for job in jobs]
+
+    chunk = max(1, len(jobs) // (workers * 4))
+    with ProcessPoolExecutor(workers, initializer=_start_worker, initargs=(data,)) as executor:
+        return list(executor.map(render, jobs, chunksize=chunk))
+
+def print_render_times(times: list):
+    for (kind, name, args, kwargs), seconds in times:
+        print(f"{kind:<5} {name:<10} {', '.join(map(str, args)):<30} {seconds * 1000:8.1f} ms")
+    print(f"{len(times)} charts, {sum(seconds for _, seconds in times):.2f}s rendering")
@@ -2,22 +2,60 @@
 # A python program that analyses and presents data from a dataset
 # comprising apps from the App Store and Google Play Store
 from functions import *
-from matplotlib import pyplot
 
-google_play = load_save_data(PATH_TO_GOOGLE_PLAY_STORE)
-app_store = load_save_data(PATH_TO_APP_STORE)
+# Everything apart from the plotting, so it can be timed on its own (see benchmark.py)
+def analyse(google_play, app_store):
+    # Took a while to load it all in in a nice format but we have it all ready now.
+    # Let's get into analysis
+    describe_app_store(app_store)
+    return analyse_google_play(google_play)
 
-# Took a while to load it all in in a nice format but we have it all ready now.
-# Let's get into analysis
-display_fields(app_store)
-print()
-google_genres = freq_table(google_play, "category")
-#display_freq_table(google_genres, is_freq_table=True, reverse=False)
+def describe_app_store(app_store):
+    display_fields(app_store)
+    print()
 
-avg_rating_for_no_of_installs = average(google_play, "installs", "rating")
-avg_rating_for_category = average(google_play, "category", "rating")
+def analyse_google_play(google_play):
+    google_genres = freq_table(google_play, "category")
+    #display_freq_table(google_genres, is_freq_table=True, reverse=False)
 
-pyplot.bar(avg_rating_for_no_of_installs[0], avg_rating_for_no_of_installs[1], color = "red")
-pyplot.show()
-pyplot.bar(avg_rating_for_category[0], avg_rating_for_category[1], color = "red")
-pyplot.show()
+    # Both averages come out of the same pass through the data
+    rating_groups = group_by(google_play, ["installs", "category"], "rating", key=str)
+    avg_rating_for_no_of_installs = average(google_play, "installs", "rating", rating_groups["installs"])
+    avg_rating_for_category = average(google_play, "category", "rating", rating_groups["category"])
+
+    # Per genre, with an app in several genres counting towards each of them (the genre
+    # column gets split out when the data's loaded, so only an AppTable has it).
+    # Installs are whole numbers so they need floats_only=False to be counted at all
+    avg_installs_for_genre = None
+    if isinstance(google_play, AppTable) and "genre" in google_play.columns:
+        avg_installs_for_genre = average(google_play, "genre", "installs", floats_only=False)
+
+    return avg_rating_for_no_of_installs, avg_rating_for_category, avg_installs_for_genre
+
+def plot(avg_rating_for_no_of_installs, avg_rating_for_category, avg_installs_for_genre=None):
+    from matplotlib import pyplot
+
+    pyplot.bar(avg_rating_for_no_of_installs[0], avg_rating_for_no_of_installs[1], color = "red")
+    pyplot.show()
+    pyplot.bar(avg_rating_for_category[0], avg_rating_for_category[1], color = "red")
+    pyplot.show()
+    if avg_installs_for_genre is not None:
+        pyplot.bar(avg_installs_for_genre[0], avg_installs_for_genre[1], color = "red")
+        pyplot.show()
+
+def main():
+    from concurrent.futures import as_completed
+
+    # Both stores load at the same time, and whichever's ready first gets looked at first
+    loads = load_many([PATH_TO_GOOGLE_PLAY_STORE, PATH_TO_APP_STORE])
+    steps = {PATH_TO_GOOGLE_PLAY_STORE: analyse_google_play, PATH_TO_APP_STORE: describe_app_store}
+    paths = {future: path for path, future in loads.items()}
+    results = {}
+    for future in as_completed(paths):
+        results[paths[future]] = steps[paths[future]](future.result())
+
+    plot(*results[PATH_TO_GOOGLE_PLAY_STORE])
+
+
+if __name__ == "__main__":
+    main()
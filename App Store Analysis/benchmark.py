@@ -0,0 +1,226 @@
+# Benchmarks for loading, cleaning and aggregating the app data, so it's easy to tell
+# if a change has made anything slower. Each case is timed on the real datasets
+# and/or made up ones of 10k, 100k, 1M or 10M rows (see synthetic.py), the results
+# can be saved as JSON, and compared against a saved baseline:
+#
+#   python benchmark.py --sizes real 10k 100k --output results.json
+#   python benchmark.py --baseline bench_baseline.json
+#   python benchmark.py --sizes real 10k --save-baseline
+#
+# profiling.py is still there for working out *where* the time goes
+import argparse, contextlib, io, json, platform, re, shutil, statistics, sys
+from datetime import datetime
+from time import perf_counter
+
+from functions import *
+from columnar import deep_sizeof
+from synthetic import SYNTHETIC_FOLDER, parse_size, synthetic_csv
+import analysis
+
+DEFAULT_SIZES = ["real", "10k"]
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+
+# Slower than the baseline by more than this (and by more than REGRESSION_MIN_SECONDS,
+# so tiny cases being a bit noisy don't count) is flagged as a regression
+REGRESSION_TOLERANCE = 1.25
+REGRESSION_MIN_SECONDS = 0.005
+
+# The regex split reads the whole file into memory, so it's only run on the smaller sizes
+LEGACY_MAX_ROWS = 100000
+
+
+# How open_data used to split the file up, kept here so there's something to compare against
+def legacy_rows(file):
+    with open(file, "r", encoding="utf-8") as f:
+        f.readline()
+        read_file = f.readlines()
+
+    return [re.split(r',(?=(?:(?:[^"]*"){2})*[^"]*$)', item.strip())
+            for item in read_file
+            if not re.findall("[\u31c0-\u9fff]", "".join(item))
+            and "Varies with device" not in item]
+
+def streamed_rows(file):
+    with open(file, "r", encoding="utf-8") as f:
+        f.readline()
+        return list(iter_rows(f))
+
+# How much memory the dict of dicts takes up next to the columnar table
+def compare_memory(path):
+    apps = quietly(load_save_data, path)
+    table = AppTable.from_dict(apps)
+
+    as_dicts, as_columns = deep_sizeof(apps), table.nbytes
+    print(os.path.basename(path))
+    print(f"  dict of dicts: {as_dicts / 1024:.0f} KiB")
+    print(f"  columnar: {as_columns / 1024:.0f} KiB ({as_dicts / as_columns:.1f}x smaller)")
+
+
+# load_save_data and friends like to chat, which isn't wanted mid-benchmark
+def quietly(func, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args, **kwargs)
+
+def cache_for(csv_file) -> str:
+    return os.path.splitext(csv_file)[0] + ".appcol"
+
+def remove_cache(csv_file):
+    if os.path.exists(cache_for(csv_file)):
+        os.remove(cache_for(csv_file))
+
+# The CSVs for a size. The real ones get copied somewhere else first, so the
+# benchmarks never touch the caches in Data/
+def dataset_files(size: str) -> tuple:
+    if size == "real":
+        os.makedirs(SYNTHETIC_FOLDER, exist_ok=True)
+        files = []
+        for path in (PATH_TO_GOOGLE_PLAY_STORE, PATH_TO_APP_STORE):
+            source = os.path.splitext(path)[0] + ".csv"
+            copy = os.path.join(SYNTHETIC_FOLDER, "real_" + os.path.basename(source))
+            if not os.path.exists(copy) or os.path.getsize(copy) != os.path.getsize(source):
+                shutil.copyfile(source, copy)
+            files.append(copy)
+        return tuple(files)
+
+    rows = parse_size(size)
+    return synthetic_csv("google", rows), synthetic_csv("apple", rows)
+
+
+# Runs func repeat times (with setup before each run, not timed), and gives back
+# the fastest and median run
+def time_case(func, repeat: int, setup=None) -> dict:
+    runs = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = perf_counter()
+        func()
+        runs.append(perf_counter() - started)
+    return {"min": min(runs), "median": statistics.median(runs), "runs": repeat}
+
+
+def run_size(size: str, repeat: int) -> dict:
+    google_csv, apple_csv = dataset_files(size)
+    rows = parse_size(size) if size != "real" else None
+    results = {}
+
+    # CSV parse: just splitting rows up, old way and new, for both stores (making
+    # sure they agree before bothering to time them)
+    for suffix, csv_file in (("", google_csv), ("_apple", apple_csv)):
+        results["parse" + suffix] = time_case(lambda: streamed_rows(csv_file), repeat)
+        if rows is None or rows <= LEGACY_MAX_ROWS:
+            if legacy_rows(csv_file) != streamed_rows(csv_file):
+                raise RuntimeError(f"the regex and streaming splits don't agree on {csv_file}")
+            results["parse_regex" + suffix] = time_case(lambda: legacy_rows(csv_file), repeat)
+
+    # Parse, clean and dedupe together, with open_data's own timings to split out
+    # how long the cleaning on its own took
+    stage_runs = []
+    def parse_and_clean():
+        timings = Timings()
+        quietly(open_data, google_csv, timings=timings)
+        stage_runs.append(timings.stages)
+    results["open_data"] = time_case(parse_and_clean, repeat)
+    for stage in ("split", "clean", "dedupe"):
+        times = [stages[stage] for stages in stage_runs]
+        results[f"stage_{stage}"] = {"min": min(times), "median": statistics.median(times), "runs": repeat}
+
+    # Cache from nothing (parse, build columns and indexes, write) and then already there
+    results["cache_cold"] = time_case(lambda: quietly(load_save_data, cache_for(google_csv), columnar=True),
+                                      repeat, setup=lambda: remove_cache(google_csv))
+    results["cache_warm"] = time_case(lambda: quietly(load_save_data, cache_for(google_csv), columnar=True),
+                                      repeat)
+    results["cache_warm_dict"] = time_case(lambda: quietly(load_save_data, cache_for(google_csv)), repeat)
+
+    google = quietly(load_save_data, cache_for(google_csv), columnar=True)
+    results["freq_table"] = time_case(
+        lambda: freq_tables(google, ["category", "genres", "content_rating", "installs"]), repeat)
+    results["average"] = time_case(lambda: quietly(average, google, "category", "rating"), repeat)
+
+    # analysis.py from start to finish, but without the charts
+    quietly(load_save_data, cache_for(apple_csv), columnar=True)
+    def end_to_end():
+        google = load_save_data(cache_for(google_csv), columnar=True)
+        apple = load_save_data(cache_for(apple_csv), columnar=True)
+        analysis.analyse(google, apple)
+    results["end_to_end"] = time_case(lambda: quietly(end_to_end), repeat)
+
+    return results
+
+
+def run(sizes: list, repeat: int) -> dict:
+    output = {"meta": {"date": datetime.now().isoformat(timespec="seconds"),
+                       "python": platform.python_version(), "platform": platform.platform(),
+                       "repeat": repeat},
+              "results": {}}
+    for size in sizes:
+        # the really big ones only get the one go
+        size_repeat = repeat if size == "real" or parse_size(size) < 1000000 else 1
+        print(f"Benchmarking {size}...", flush=True)
+        output["results"][size] = run_size(size, size_repeat)
+    return output
+
+
+# Prints every case next to its baseline, and gives back the ones that got slower
+def compare(results: dict, baseline: dict) -> list:
+    regressions = []
+    print(f"{'size':<6} {'case':<18} {'now':>10} {'baseline':>10} {'change':>8}")
+    for size, cases in results["results"].items():
+        for case, timing in cases.items():
+            before = baseline.get("results", {}).get(size, {}).get(case)
+            now = timing["min"]
+            if before is None:
+                print(f"{size:<6} {case:<18} {now * 1000:>8.1f}ms {'-':>10} {'new':>8}")
+                continue
+
+            before = before["min"]
+            ratio = now / before if before else float("inf")
+            flag = ""
+            if ratio > REGRESSION_TOLERANCE and now - before > REGRESSION_MIN_SECONDS:
+                regressions.append((size, case, before, now))
+                flag = "  <-- slower"
+            print(f"{size:<6} {case:<18} {now * 1000:>8.1f}ms {before * 1000:>8.1f}ms {ratio:>7.2f}x{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time loading, cleaning and aggregating the app data")
+    parser.add_argument("--sizes", nargs="+", default=DEFAULT_SIZES,
+                        help="real and/or row counts like 10k 100k 1M 10M")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="where to save the results as JSON")
+    parser.add_argument("--baseline", default=BASELINE, help="results to compare against")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="save these results as the new baseline")
+    parser.add_argument("--memory", action="store_true",
+                        help="also compare the memory of dicts and columns on the real data")
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.repeat)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    regressions = []
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print("Saved baseline to", args.baseline)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f))
+    else:
+        compare(results, {})
+
+    if args.memory:
+        for path in (PATH_TO_GOOGLE_PLAY_STORE, PATH_TO_APP_STORE):
+            compare_memory(path)
+
+    if regressions:
+        print(f"\n{len(regressions)} case(s) slower than the baseline")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
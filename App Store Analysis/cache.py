@@ -0,0 +1,277 @@
+# The on-disk cache for an AppTable. Unpickling meant reading and rebuilding the
+# whole dataset before anything could happen, so instead every column is written
+# out as raw fixed-width numbers (or a UTF-8 heap plus offsets for text) and the
+# file gets memory-mapped. Opening it is near enough instant, a column is only
+# read off disk the first time something asks for it, and since the mapping is
+# read-only, several processes can share the same pages
+import hashlib, json, mmap, os, pickle, sys, tempfile
+from array import array
+from collections.abc import Mapping
+from datetime import date
+
+from columnar import AppTable, ArrayColumn, CategoryColumn, MultiValueColumn, TextColumn
+from indexes import HashIndex, SortedIndex
+
+MAGIC = b"APPCOL\x01\n"
+CACHE_VERSION = 3
+ALIGNMENT = 8
+
+# The types odd cells in a typed column can be, so they can be written as JSON
+ODD_TYPES = {"str": str, "int": int, "float": float, "date": date.fromordinal}
+
+
+class CacheError(Exception):
+    pass
+
+
+# blake2b is quick enough that hashing the CSVs costs next to nothing
+def hash_file(path, length=None) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    remaining = os.path.getsize(path) if length is None else length
+    with open(path, "rb") as f:
+        while remaining > 0:
+            chunk = f.read(min(remaining, 1 << 20))
+            if not chunk:
+                break
+            digest.update(chunk)
+            remaining -= len(chunk)
+    return digest.hexdigest()
+
+# What a source CSV looked like when a cache was made from it. rows is how many
+# records were read, which the next read needs if rows get added to the end
+def fingerprint(path, rows: int) -> dict:
+    stat = os.stat(path)
+    with open(path, "rb") as f:
+        f.seek(max(stat.st_size - 1, 0))
+        ends_with_newline = f.read(1) == b"\n"
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "hash": hash_file(path),
+            "rows": rows, "ends_with_newline": ends_with_newline}
+
+# Compares a cache's manifest against the CSV as it is now:
+# "fresh" - nothing's changed, use the cache
+# "appended" - the old file is all still there with new rows after it
+# "stale" - anything else, so the cache needs rebuilding
+def source_status(manifest: dict, path, parser_version: int) -> str:
+    if not manifest or manifest.get("parser_version") != parser_version:
+        return "stale"
+
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        # nothing to check it against, so the cache is all there is
+        return "fresh"
+
+    source = manifest["source"]
+    if stat.st_size == source["size"]:
+        # Same size and time is trusted without reading the file. Otherwise it might just
+        # have been touched or checked out again, so check what's actually in it
+        if stat.st_mtime_ns == source["mtime_ns"] or hash_file(path) == source["hash"]:
+            return "fresh"
+    elif (stat.st_size > source["size"] and source["ends_with_newline"]
+          and hash_file(path, source["size"]) == source["hash"]):
+        return "appended"
+
+    return "stale"
+
+
+def _encode_odd(value):
+    if isinstance(value, date):
+        return ["date", value.toordinal()]
+    return [type(value).__name__, value]
+
+def _decode_odd(kind, value):
+    return ODD_TYPES[kind](value)
+
+
+# Collects the raw bytes of each buffer, remembering where each one will end up
+class _BufferWriter:
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def add(self, data, typecode=None) -> dict:
+        raw = bytes(data)
+        padding = -self.size % ALIGNMENT
+        if padding:
+            self.chunks.append(b"\0" * padding)
+            self.size += padding
+
+        spec = {"offset": self.size, "length": len(raw)}
+        if typecode:
+            spec["typecode"] = typecode
+        self.chunks.append(raw)
+        self.size += len(raw)
+        return spec
+
+
+def _typecode(data):
+    return data.typecode if isinstance(data, array) else data.format
+
+def _column_spec(column, buffers: _BufferWriter) -> dict:
+    if isinstance(column, ArrayColumn):
+        return {"type": "array", "kind": column.kind, "typecode": column.typecode,
+                "data": buffers.add(column.data, _typecode(column.data)),
+                "odd": [[row] + _encode_odd(value) for row, value in column.odd.items()]}
+
+    if isinstance(column, CategoryColumn):
+        return {"type": "category", "categories": list(column.categories),
+                "codes": buffers.add(column.codes, _typecode(column.codes))}
+
+    if isinstance(column, MultiValueColumn):
+        return {"type": "multi", "categories": [_encode_odd(value) for value in column.categories],
+                "offsets": buffers.add(column.offsets, _typecode(column.offsets)),
+                "codes": buffers.add(column.codes, _typecode(column.codes))}
+
+    if isinstance(column, TextColumn):
+        return {"type": "text", "heap": buffers.add(column.heap),
+                "offsets": buffers.add(column.offsets, _typecode(column.offsets)),
+                "tags": buffers.add(column.tags, "b") if column.tags is not None else None}
+
+    # anything too mixed for the other column types
+    return {"type": "pickle", "data": buffers.add(
+        pickle.dumps(list(column), protocol=pickle.HIGHEST_PROTOCOL))}
+
+def _index_spec(index, buffers: _BufferWriter) -> dict:
+    if isinstance(index, HashIndex):
+        return {"type": "hash", "values": [_encode_odd(value) for value in index.values],
+                "offsets": buffers.add(index.offsets, "I"), "rows": buffers.add(index.rows, "I")}
+    return {"type": "sorted", "keys": buffers.add(index.keys, "d"), "rows": buffers.add(index.rows, "I")}
+
+
+def write_cache(table: AppTable, path, manifest=None):
+    buffers = _BufferWriter()
+    header = {
+        "version": CACHE_VERSION,
+        "manifest": manifest,
+        "byteorder": sys.byteorder,
+        "key": table.key,
+        "headers": table.headers,
+        "order": buffers.add(table._order, _typecode(table._order)),
+        # every column, including any split out of another (see split_columns)
+        "columns": {name: _column_spec(column, buffers) for name, column in table.columns.items()},
+        "indexes": {name: _index_spec(index, buffers) for name, index in table.indexes.items()},
+    }
+    header = json.dumps(header).encode("utf-8")
+    # pad the header so the buffers after it start lined up
+    header += b" " * (-(len(MAGIC) + 8 + len(header)) % ALIGNMENT)
+
+    # Write somewhere else first and swap it in, so anything that already has
+    # the old cache mapped keeps seeing a whole file
+    folder = os.path.dirname(os.path.abspath(path))
+    handle, temp_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+    try:
+        with os.fdopen(handle, "wb") as f:
+            f.write(MAGIC)
+            f.write(len(header).to_bytes(8, "little"))
+            f.write(header)
+            for chunk in buffers.chunks:
+                f.write(chunk)
+        # mkstemp makes it private to us, but other users' processes can share it too
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+# A slice of the mapped file, seen as whatever type of number it holds
+def _view(data: memoryview, spec: dict) -> memoryview:
+    view = data[spec["offset"]:spec["offset"] + spec["length"]]
+    return view.cast(spec["typecode"]) if "typecode" in spec else view
+
+# Only turns a column's (or index's) bytes into one the first time it's asked for
+class LazyColumns(Mapping):
+    def __init__(self, specs: dict, data: memoryview):
+        self._specs = specs
+        self._data = data
+        self._loaded = {}
+
+    def _load(self, spec):
+        buffer = lambda name: _view(self._data, spec[name])
+
+        if spec["type"] == "array":
+            odd = {row: _decode_odd(kind, value) for row, kind, value in spec["odd"]}
+            return ArrayColumn(spec["typecode"], buffer("data"), odd, spec["kind"])
+        if spec["type"] == "category":
+            return CategoryColumn(spec["categories"], buffer("codes"))
+        if spec["type"] == "multi":
+            categories = [_decode_odd(kind, value) for kind, value in spec["categories"]]
+            return MultiValueColumn(categories, buffer("offsets"), buffer("codes"))
+        if spec["type"] == "text":
+            return TextColumn(buffer("heap"), buffer("offsets"),
+                              buffer("tags") if spec["tags"] else None)
+        if spec["type"] == "hash":
+            values = [_decode_odd(kind, value) for kind, value in spec["values"]]
+            return HashIndex(values, buffer("offsets"), buffer("rows"))
+        if spec["type"] == "sorted":
+            return SortedIndex(buffer("keys"), buffer("rows"))
+        return pickle.loads(buffer("data"))
+
+    def __getitem__(self, name):
+        if name not in self._loaded:
+            self._loaded[name] = self._load(self._specs[name])
+        return self._loaded[name]
+
+    def __iter__(self):
+        return iter(self._specs)
+
+    def __len__(self):
+        return len(self._specs)
+
+
+# The header at the start of a cache, with where the buffers after it start, or
+# None if it isn't a cache (or it's been cut short or damaged)
+def _read_header(view: memoryview):
+    if bytes(view[:len(MAGIC)]) != MAGIC:
+        return None
+    header_length = int.from_bytes(view[len(MAGIC):len(MAGIC) + 8], "little")
+    data_start = len(MAGIC) + 8 + header_length
+    try:
+        header = json.loads(str(view[len(MAGIC) + 8:data_start], "utf-8"))
+    except ValueError:
+        return None
+    if not isinstance(header, dict) or data_start > len(view):
+        return None
+    header["data_start"] = data_start
+    return header
+
+# Where the last of the buffers in a header (or a piece of one) ends
+def _extent(spec) -> int:
+    if isinstance(spec, dict):
+        end = spec["offset"] + spec["length"] if "offset" in spec and "length" in spec else 0
+        return max([end] + [_extent(value) for value in spec.values()])
+    if isinstance(spec, list):
+        return max([0] + [_extent(value) for value in spec])
+    return 0
+
+# Memory-maps the cache at path. Nothing gets read until it's used, and the file
+# stays mapped until table.close() (or the table's gone)
+def read_cache(path) -> AppTable:
+    with open(path, "rb") as f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError as error:
+            # an empty file can't be mapped
+            raise CacheError(f"{path} isn't an app cache file") from error
+
+    with memoryview(mapped) as view:
+        header = _read_header(view)
+    if header is None or header.get("version") != CACHE_VERSION or header.get("byteorder") != sys.byteorder:
+        mapped.close()
+        raise CacheError(f"{path} isn't an app cache file" if header is None
+                         else f"{path} was written by a different version or machine")
+
+    try:
+        data = memoryview(mapped)[header["data_start"]:]
+        # a file that's been cut short would otherwise just look like fewer rows
+        if _extent([header["order"], header["columns"], header["indexes"]]) > len(data):
+            raise ValueError("buffers run past the end of the file")
+        columns = LazyColumns(header["columns"], data)
+        table = AppTable(header["headers"], columns, header["key"], _view(data, header["order"]))
+        table.manifest = header["manifest"]
+        table.indexes = LazyColumns(header["indexes"], data)
+    except (KeyError, TypeError, ValueError) as error:
+        raise CacheError(f"{path} is damaged") from error
+    # so it can be unmapped with table.close()
+    table.mapped = mapped
+    return table
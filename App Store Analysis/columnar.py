@@ -0,0 +1,469 @@
+# A column-by-column way of holding the app data. Instead of every app carrying
+# its own dict with the same 13-16 keys, each field gets one typed array (or a
+# list of codes into a shared list of categories for strings), and rows are
+# just views into those columns so the rest of the code can carry on as normal
+import sys
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from collections.abc import Mapping
+from datetime import date
+
+# numpy is only needed for the vectorised bits, everything else works without it.
+# It gets imported the first time one of those is used, since importing it takes
+# longer than importing everything else here put together
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+# A typed array is only worth it if at least this much of the column fits the type
+TYPED_COLUMN_SHARE = 0.75
+
+NUMPY_DTYPES = {"b": "int8", "h": "int16", "i": "int32", "q": "int64", "d": "float64"}
+
+# Fields holding several values at once, and the column each gets split out into:
+# {new column: (field, separator)}. Google's genres look like "Art & Design;Pretend Play"
+SPLIT_COLUMNS = {"genre": ("genres", ";")}
+
+# Columns can sit on top of a memoryview (like a memory-mapped cache file)
+# without copying it, otherwise the values go into a fresh typed array
+def as_buffer(typecode: str, data):
+    if isinstance(data, memoryview):
+        return data
+    return array(typecode, data)
+
+# Smallest signed array type that'll hold every number between low and high
+def int_typecode(low: int, high: int) -> str:
+    for typecode in ("b", "h", "i", "q"):
+        bits = array(typecode).itemsize * 8
+        if -2**(bits - 1) <= low and high < 2**(bits - 1):
+            return typecode
+    return None
+
+
+# Numbers (or dates, stored as ordinals) in a typed array. Cells that aren't the
+# column's type (like Google's "NaN" ratings) are kept in `odd` against their row,
+# with a placeholder left in the array so positions still line up
+class ArrayColumn:
+    def __init__(self, typecode: str, data=(), odd=None, kind=None):
+        self.typecode = typecode
+        self.data = as_buffer(typecode, data)
+        self.odd = odd or {}
+        self.kind = kind
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, row: int):
+        if row in self.odd:
+            return self.odd[row]
+        value = self.data[row]
+        return date.fromordinal(value) if self.kind == "date" else value
+
+    def __iter__(self):
+        for row in range(len(self.data)):
+            yield self[row]
+
+    @property
+    def nbytes(self):
+        return self.data.itemsize * len(self.data) + deep_sizeof(self.odd)
+
+    # Rows that actually hold the column's type, for vectorised maths
+    def valid_rows(self):
+        return [row for row in range(len(self.data)) if row not in self.odd]
+
+    def to_numpy(self):
+        np = _numpy()
+        if np is None:
+            raise ImportError("numpy is needed for to_numpy()")
+        return np.frombuffer(self.data, dtype=NUMPY_DTYPES[self.typecode])
+
+
+# Strings that repeat a lot (category, genres, content rating...) stored once each,
+# with a small integer code per row pointing at them
+class CategoryColumn:
+    def __init__(self, categories: list, codes=()):
+        self.categories = categories
+        self.codes = as_buffer("H" if len(categories) <= 0xFFFF else "I", codes)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, row: int):
+        return self.categories[self.codes[row]]
+
+    def __iter__(self):
+        categories = self.categories
+        for code in self.codes:
+            yield categories[code]
+
+    @property
+    def nbytes(self):
+        return self.codes.itemsize * len(self.codes) + deep_sizeof(self.categories)
+
+    def to_numpy(self):
+        np = _numpy()
+        if np is None:
+            raise ImportError("numpy is needed for to_numpy()")
+        return np.frombuffer(self.codes, dtype="uint16" if self.codes.itemsize == 2 else "uint32")
+
+
+# A field with several values per row (like Google's genres) split up the once. Every
+# row's codes go one after the other, with offsets saying where each row's start and
+# end (like a CSR sparse matrix), pointing into one shared list of the values. So
+# counting, grouping or finding apps by one genre never has to split a string again.
+# A value listed twice in the same row ("Education;Education") only counts once
+class MultiValueColumn:
+    def __init__(self, categories: list, offsets, codes):
+        self.categories = categories
+        self.offsets = as_buffer("I", offsets)
+        self.codes = as_buffer("H" if len(categories) <= 0xFFFF else "I", codes)
+
+    @classmethod
+    def from_values(cls, values, separator=";"):
+        # a category column's combinations only need splitting once each, not once per row
+        if isinstance(values, CategoryColumn):
+            combinations, per_row = values.categories, values.codes
+        else:
+            lookup = {}
+            per_row = [lookup.setdefault(value, len(lookup)) for value in values]
+            combinations = list(lookup)
+
+        lookup = {}
+        split = []
+        for combination in combinations:
+            parts = combination.split(separator) if isinstance(combination, str) else [combination]
+            split.append([lookup.setdefault(part, len(lookup)) for part in dict.fromkeys(parts)])
+
+        offsets, codes = [0], []
+        for code in per_row:
+            codes += split[code]
+            offsets.append(len(codes))
+        return cls(list(lookup), offsets, codes)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row: int):
+        categories = self.categories
+        return [categories[code] for code in self.codes[self.offsets[row]:self.offsets[row + 1]]]
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self[row]
+
+    @property
+    def nbytes(self):
+        return (self.offsets.itemsize * len(self.offsets) + self.codes.itemsize * len(self.codes)
+                + deep_sizeof(self.categories))
+
+    # Which row each code belongs to, so numbers for each row can be lined up with them
+    def row_ids(self) -> list:
+        np = _numpy()
+        if np is not None:
+            offsets = np.frombuffer(self.offsets, dtype="uint32")
+            return np.repeat(np.arange(len(self)), np.diff(offsets)).tolist()
+        offsets = self.offsets
+        return [row for row in range(len(self)) for _ in range(offsets[row + 1] - offsets[row])]
+
+    def to_numpy(self):
+        np = _numpy()
+        if np is None:
+            raise ImportError("numpy is needed for to_numpy()")
+        return (np.frombuffer(self.offsets, dtype="uint32"),
+                np.frombuffer(self.codes, dtype="uint16" if self.codes.itemsize == 2 else "uint32"))
+
+
+# Builds a CategoryColumn a value at a time while a CSV is being parsed, handing back
+# the one shared (interned) copy of each string, so every row holding it points at the
+# same object rather than its own. If anything that isn't a string turns up, or the
+# values hardly repeat after all, column() gives back None and it gets built as usual
+class CategoryBuilder:
+    def __init__(self):
+        self.lookup = {}
+        self.categories = []
+        self.codes = array("I")
+        self.mixed = False
+
+    def add(self, value):
+        if self.mixed or type(value) is not str:
+            self.mixed = True
+            return value
+        code = self.lookup.get(value)
+        if code is None:
+            value = sys.intern(value)
+            code = self.lookup[value] = len(self.categories)
+            self.categories.append(value)
+        self.codes.append(code)
+        return self.categories[code]
+
+    def column(self):
+        if self.mixed or len(self.categories) > len(self.codes) // 2:
+            return None
+        return CategoryColumn(self.categories, self.codes)
+
+
+# Strings that are mostly unique (app names, version numbers) packed end to end
+# as UTF-8 in one bytes heap, with offsets saying where each one starts and ends.
+# Version numbers come out of cleaning as a mix of str, int and float, so those
+# are stored as text too with a one byte tag per row to turn them back
+class TextColumn:
+    TAGS = (str, int, float)
+
+    def __init__(self, heap: bytes, offsets, tags=None):
+        self.heap = heap
+        self.offsets = as_buffer("I" if len(heap) <= 0xFFFFFFFF else "Q", offsets)
+        self.tags = as_buffer("b", tags) if tags is not None else None
+
+    @classmethod
+    def from_values(cls, values: list):
+        encoded = [(value if type(value) is str else repr(value)).encode("utf-8") for value in values]
+        offsets = [0]
+        for item in encoded:
+            offsets.append(offsets[-1] + len(item))
+
+        tags = None
+        if any(type(value) is not str for value in values):
+            tags = [cls.TAGS.index(type(value)) for value in values]
+        return cls(b"".join(encoded), offsets, tags)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row: int):
+        value = str(self.heap[self.offsets[row]:self.offsets[row + 1]], "utf-8")
+        if self.tags is not None and self.tags[row]:
+            return self.TAGS[self.tags[row]](value)
+        return value
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self[row]
+
+    @property
+    def nbytes(self):
+        return (len(self.heap) + self.offsets.itemsize * len(self.offsets)
+                + (len(self.tags) if self.tags is not None else 0))
+
+
+# How many times each value turns up in a column, in the order they first appear.
+# Category columns are counted on their codes (with numpy's bincount if it's there)
+# so the strings themselves never get looked at. For a multi-valued column it's how
+# many rows have each value
+def value_counts(column) -> dict:
+    if isinstance(column, (CategoryColumn, MultiValueColumn)):
+        np = _numpy()
+        if np is not None and len(column.codes):
+            codes = column.to_numpy()[1] if isinstance(column, MultiValueColumn) else column.to_numpy()
+            counts = np.bincount(codes, minlength=len(column.categories)).tolist()
+        else:
+            counts = [0] * len(column.categories)
+            for code in column.codes:
+                counts[code] += 1
+        return {value: count for value, count in zip(column.categories, counts) if count}
+
+    counts = {}
+    for value in column:
+        counts[value] = counts.get(value, 0) + 1
+    return counts
+
+
+# Picks the smallest way of holding a column of values. Anything that isn't
+# numbers, dates or text (or is too mixed to tell) just stays a list
+def build_column(values: list):
+    if not values:
+        return []
+
+    types = Counter(type(value) for value in values)
+    kind, count = types.most_common(1)[0]
+
+    if kind is str:
+        if count == len(values):
+            categories = {}
+            codes = [categories.setdefault(value, len(categories)) for value in values]
+            if len(categories) <= len(values) // 2:
+                return CategoryColumn(list(categories), codes)
+        if set(types) <= set(TextColumn.TAGS):
+            return TextColumn.from_values(values)
+        return list(values)
+
+    if count < len(values) * TYPED_COLUMN_SHARE:
+        return list(values)
+
+    if kind is int:
+        numbers = [value for value in values if type(value) is int]
+        typecode, placeholder, encode = int_typecode(min(numbers), max(numbers)), 0, int
+        if typecode is None:
+            return list(values)
+    elif kind is float:
+        typecode, placeholder, encode = "d", float("nan"), float
+    elif kind is date:
+        typecode, placeholder, encode = "i", 0, date.toordinal
+    else:
+        return list(values)
+
+    odd = {}
+    data = []
+    for row, value in enumerate(values):
+        if type(value) is kind:
+            data.append(encode(value))
+        else:
+            odd[row] = value
+            data.append(placeholder)
+
+    return ArrayColumn(typecode, data, odd, "date" if kind is date else None)
+
+
+# Dict-like view of one app, so item["rating"] and friends still work
+class Row(Mapping):
+    __slots__ = ("_table", "_row")
+
+    def __init__(self, table, row: int):
+        self._table = table
+        self._row = row
+
+    def __getitem__(self, header):
+        return self._table.columns[header][self._row]
+
+    def __iter__(self):
+        return iter(self._table.headers)
+
+    def __len__(self):
+        return len(self._table.headers)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+# Behaves like the {id: {header: value}} dict open_data returns, but stores columns
+class AppTable(Mapping):
+    def __init__(self, headers: list, columns: dict, key="id", order=None):
+        self.headers = list(headers)
+        self.columns = columns
+        self.key = key
+        # Rows sorted by key, so an app can be found with a binary search
+        # rather than keeping a whole dict of ids around
+        keys = columns[key]
+        self._keys = keys
+        if order is None:
+            order = sorted(range(len(keys)), key=keys.__getitem__)
+        self._order = as_buffer("I", order)
+        # Filled in by read_cache with what the cache was made from, and the file
+        # mapping everything's read out of
+        self.manifest = None
+        self.mapped = None
+        # {column: index} for query() to use, see indexes.py
+        self.indexes = {}
+
+    # built is any columns that have already been made (like the category columns
+    # open_data encodes as it goes), which are used as they are
+    @classmethod
+    def from_rows(cls, headers: list, rows: list, key="id", built=None):
+        built = built or {}
+        columns = zip(*rows) if rows else [[] for _ in headers]
+        table = {}
+        for header, values in zip(headers, columns):
+            column = built.get(header)
+            table[header] = column if column is not None and len(column) == len(rows) else build_column(list(values))
+        return cls(headers, table, key)
+
+    @classmethod
+    def from_dict(cls, apps: dict, key="id", built=None):
+        headers = list(next(iter(apps.values())).keys()) if apps else [key]
+        return cls.from_rows(headers, [list(app.values()) for app in apps.values()], key, built)
+
+    def _find(self, key) -> int:
+        keys = self._keys
+        position = bisect_left(self._order, key, key=keys.__getitem__)
+        if position < len(self._order) and keys[self._order[position]] == key:
+            return self._order[position]
+        raise KeyError(key)
+
+    def __getitem__(self, key):
+        return Row(self, self._find(key))
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        try:
+            self._find(key)
+        except (KeyError, TypeError):
+            return False
+        return True
+
+    # Skips the id lookup that the default Mapping.values() would do per row
+    def rows(self):
+        for row in range(len(self)):
+            yield Row(self, row)
+
+    def values(self):
+        return list(self.rows())
+
+    def items(self):
+        return list(zip(self._keys, self.rows()))
+
+    def column(self, header: str):
+        return self.columns[header]
+
+    # Lets go of the file read_cache mapped the table from, so it can be replaced
+    # (Windows won't while it's still mapped). The table's empty afterwards, and
+    # any columns taken out of it need letting go of first or this raises BufferError
+    def close(self):
+        if self.mapped is None:
+            return
+        self.columns, self.indexes = {}, {}
+        self._keys, self._order = [], as_buffer("I", [])
+        self.mapped.close()
+        self.mapped = None
+
+    @property
+    def nbytes(self):
+        total = self._order.itemsize * len(self._order)
+        for column in self.columns.values():
+            if isinstance(column, list):
+                total += deep_sizeof(column)
+            else:
+                total += column.nbytes
+        return total
+
+
+# One field of a store as something that can be indexed by row, whether the store
+# is an AppTable or the plain {id: {header: value}} dict
+def get_column(store, name: str):
+    if isinstance(store, AppTable):
+        return store.columns[name]
+    return [item[name] for item in store.values()]
+
+def get_headers(store) -> list:
+    if isinstance(store, AppTable):
+        return store.headers
+    return list(next(iter(store.values()), {}))
+
+# The SPLIT_COLUMNS a table has the fields for, to go alongside its own columns. They
+# aren't in its headers, so rows (and the dicts made from them) look the same as before
+def split_columns(table: AppTable, split=SPLIT_COLUMNS) -> dict:
+    return {name: MultiValueColumn.from_values(table.columns[field], separator)
+            for name, (field, separator) in split.items() if field in table.headers}
+
+
+# Roughly how much memory something takes up, counting everything it holds
+# (but only once, so shared strings and header keys aren't counted twice)
+def deep_sizeof(obj, seen=None) -> int:
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(key, seen) + deep_sizeof(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    return size
@@ -1,53 +1,52 @@
-import re, inspect, threading, time, os, pickle
-from datetime import datetime
-from queue import Queue
+import re, os, heapq, calendar
+from datetime import date, datetime
+from functools import lru_cache, partial
+from itertools import chain, islice, repeat
+from time import perf_counter
+from columnar import AppTable, CategoryBuilder, CategoryColumn, MultiValueColumn, split_columns, value_counts
+from progress import Progress, ProgressBoard, SharedTimings, Timings
+from indexes import build_indexes
+from instrument import instrument
 
-global finished
-finished = False
 DATA_FOLDER = os.path.join(os.path.dirname(__file__), "Data")
 
-PATH_TO_APP_STORE = os.path.join(DATA_FOLDER, "AppleStore.pickle")
-PATH_TO_GOOGLE_PLAY_STORE = os.path.join(DATA_FOLDER, "googleplaystore.pickle")
+PATH_TO_APP_STORE = os.path.join(DATA_FOLDER, "AppleStore.appcol")
+PATH_TO_GOOGLE_PLAY_STORE = os.path.join(DATA_FOLDER, "googleplaystore.appcol")
 
 RE_FLOAT = re.compile(r"[0-9.]+$")
 RE_M = re.compile(r"[0-9.]+M$")
 RE_K = re.compile(r"[0-9.]+k$")
+RE_INSTALLS_QUOTED = re.compile(r'[015]\+"?$')
+RE_INSTALLS = re.compile(r"(?<![\w\s])\d+\+$")
+RE_INSTALLS_FULL = re.compile(r'"([\d,]*[015])\+"|(\d+)\+')
+
+# Bump this whenever the way a CSV gets parsed or cleaned changes, so old caches get rebuilt
+PARSER_VERSION = 1
+
+# How many rows open_data looks at before deciding what type each column is
+SCHEMA_SAMPLE_ROWS = 200
+
+# How many different values each column remembers the converted version of
+CONVERSION_CACHE_SIZE = 4096
+
+# Columns where more than this share of the sampled values are different from each
+# other (names, ids, review counts) don't get a cache, they'd hardly ever hit it
+UNCACHED_DISTINCT_SHARE = 0.9
+
+# Smallest piece of a CSV open_data_parallel will hand to a worker process
+MIN_CHUNK_BYTES = 1 << 20
 
 # stole this online: https://stackoverflow.com/questions/18425225/getting-the-name-of-a-variable-as-a-string
 # uses the inspect module to have a look at the local variable of the previous previous frame (in this case, call)
 # and check to see what the name of the variable passed to the function is called
 def retrieve_name(var):
+    import inspect
     callers_local_vars = inspect.currentframe().f_back.f_back.f_locals.items()
     return [var_name for var_name, var_val in callers_local_vars if var_val is var]
 
-def custom_thread(target_1: tuple, target_2: tuple):
-    progress_thread = threading.Thread(target=target_1[0], args=target_1[1])
-    progress_thread.start()
-
-    gen_thread = threading.Thread(target=target_2[0], args=target_2[1])
-    gen_thread.start()
-
-    gen_thread.join()
-    globals()["finished"] = True
-    # Retrieve dataset from queue
-    progress_thread.join()
-    globals()["finished"] = False
-
-
-def show_progress(string):
-    print(string, end='\r')
-    dot = 0
-    space = " " * (len(string) + 4) + "\033[A"
-    while not finished:
-        print(space)
-        print(string + "." * ((dot % 3)+1), end="\r")
-        time.sleep(0.3)
-        dot += 1
-    print(space, end="\n")
-
-
 # Essentially cleans the data
-def app_value_clean(value: str, output: list, iteration=None,
+# Still used for any cell that doesn't fit its column's converter (see infer_schema)
+def app_value_clean(value: str, output: list = None, iteration=None,
                     re_float=RE_FLOAT, re_m=RE_M, re_k=RE_K):
 
     def isfloat(val):
@@ -70,12 +69,12 @@ def app_value_clean(value: str, output: list, iteration=None,
 
     # There are some instances where the number of installs is *multiple of 10*+
     # We can't use this number to do any maths with so convert to int
-    elif value.startswith('"') and re.search(r'[015]\+"?$', value):
+    elif value.startswith('"') and RE_INSTALLS_QUOTED.search(value):
         value = int(
             "".join([letter for letter in value[1:-2] if letter != ","]))
     
     # For cases where the number of installs is not enclosed in quotations
-    elif re.search(r"(?<![\w\s])\d+\+$", value):
+    elif RE_INSTALLS.search(value):
         value = int(value[:-1])
 
     elif re_m.match(value) and isfloat(value[:-1]):
@@ -87,7 +86,7 @@ def app_value_clean(value: str, output: list, iteration=None,
     # If it's a date, convert to date
     elif value.startswith('"') and value.endswith('"'):
         try:
-            value = datetime.strptime(value, '"%B %d, %Y"').date()
+            value = parse_date(value)
         except ValueError:
             pass
     
@@ -95,139 +94,696 @@ def app_value_clean(value: str, output: list, iteration=None,
         value = float(value[1:])
 
     # finally, update the dictionary
-    output += [value]
+    if output is not None:
+        output += [value]
+    return value
+
+# Converters for a whole column at a time. Each one only takes the cells that
+# app_value_clean would have turned into the same thing, and raises ValueError
+# for anything else so that cell can go the long way round instead
+def to_int(value: str):
+    if not value.isdigit():
+        raise ValueError(value)
+    return int(value)
+
+def to_megabytes(value: str):
+    if not value.isdigit():
+        raise ValueError(value)
+    return round(float(value) / 1000000, 2)
+
+def to_float(value: str):
+    if value.isdigit() or not RE_FLOAT.match(value) or value.count(".") > 1:
+        raise ValueError(value)
+    return float(value)
+
+# "10,000+" or 4+
+def to_installs(value: str):
+    match = RE_INSTALLS_FULL.fullmatch(value)
+    if not match:
+        raise ValueError(value)
+    return int((match.group(1) or match.group(2)).replace(",", ""))
+
+# 19M or 512k, in megabytes
+def to_size(value: str):
+    unit = value[-1:]
+    if unit not in ("M", "k") or not RE_FLOAT.match(value[:-1]):
+        raise ValueError(value)
+    size = float(value[:-1])
+    return size if unit == "M" else size / 1000
+
+# $0.99
+def to_price(value: str):
+    if not value.startswith("$"):
+        raise ValueError(value)
+    return float(value[1:])
+
+# "January 7, 2018"
+def to_date(value: str):
+    if not (value.startswith('"') and value.endswith('"')):
+        raise ValueError(value)
+    return parse_date(value)
+
+RE_DATE = re.compile(r'"([A-Z][a-z]+) (\d{1,2}), (\d{4})"')
+MONTH_NUMBERS = {name: number for number, name in enumerate(calendar.month_name) if name}
+
+# Same as datetime.strptime(value, '"%B %d, %Y"').date(), which is really slow, for the
+# dates that are written the usual way. Anything else (like "JANUARY") is left to strptime
+def parse_date(value: str) -> date:
+    match = RE_DATE.fullmatch(value)
+    if match and match.group(1) in MONTH_NUMBERS:
+        month, day, year = match.groups()
+        return date(int(year), MONTH_NUMBERS[month], int(day))
+    return datetime.strptime(value, '"%B %d, %Y"').date()
+
+# Anything that could be a number, install count, date or price isn't plain text
+def to_text(value: str):
+    if value[:1] in '."$' or value[:1].isdigit() or value.endswith("+"):
+        raise ValueError(value)
+    return value
+
+# Values that were never strings to begin with (like Google's made up id)
+def keep_value(value):
+    return value
+
+# Order matters here, it's the tie-breaker when two converters fit the sample equally well
+COLUMN_CONVERTERS = (to_int, to_float, to_installs, to_size, to_price, to_date, to_text)
+
+# Works out the type of each column once from a sample of rows, rather than
+# app_value_clean working it out again for every single cell.
+# Picks whichever converter takes the most of the sampled cells
+def infer_schema(sample: list) -> list:
+    schema = []
+    for index, column in enumerate(zip(*sample)):
+        best, best_hits = None, 0
+        for converter in COLUMN_CONVERTERS:
+            hits = 0
+            for value in column:
+                try:
+                    converter(value)
+                    hits += 1
+                except ValueError:
+                    pass
+            if hits > best_hits:
+                best, best_hits = converter, hits
+
+        # this is where the size is held in the apple db
+        if best is to_int and index == 2:
+            best = to_megabytes
+        schema.append(best or partial(app_value_clean, iteration=index))
+
+    return schema
+
+# A column's converter, with app_value_clean for the odd ones out
+def _convert_cell(converter, index: int):
+    def convert(value):
+        try:
+            return converter(value)
+        except ValueError:
+            return app_value_clean(value, iteration=index)
+    return convert
+
+# The schema with each column remembering what it's converted before, so a value it's
+# already seen (the same date, install count or size, over and over) is just a lookup.
+# Each column keeps up to size values, dropping whichever was used longest ago.
+# Columns that are nearly all different in the sample (like names, or Google's made
+# up ids) are different every time so there's no point remembering them
+def cached_schema(schema: list, sample: list, size=CONVERSION_CACHE_SIZE) -> list:
+    columns = list(zip(*sample))
+    cached = []
+    for index, converter in enumerate(schema):
+        if converter is not keep_value:
+            converter = _convert_cell(converter, index)
+            if index >= len(columns) or distinct_share(columns[index]) <= UNCACHED_DISTINCT_SHARE:
+                converter = lru_cache(maxsize=size)(converter)
+        cached.append(converter)
+    return cached
+
+# How well each column's cache did, as {header: {"hits": ..., "misses": ..., "size": ...}}
+def conversion_stats(headers, schema: list) -> dict:
+    stats = {}
+    for header, converter in zip(headers, schema):
+        if hasattr(converter, "cache_info"):
+            info = converter.cache_info()
+            stats[header] = {"hits": info.hits, "misses": info.misses, "size": info.currsize}
+    return stats
+
+def merge_conversion_stats(stats: dict, other: dict):
+    for header, counts in other.items():
+        totals = stats.setdefault(header, {"hits": 0, "misses": 0, "size": 0})
+        for name, count in counts.items():
+            totals[name] = max(totals[name], count) if name == "size" else totals[name] + count
+
+def print_conversion_stats(stats: dict):
+    for header, counts in stats.items():
+        lookups = counts["hits"] + counts["misses"]
+        rate = counts["hits"] / lookups if lookups else 0
+        print(f"  {header:<20} {rate:6.1%} of {lookups} hit, {counts['size']} remembered")
+
+# Converts a row using its column converters, with app_value_clean for the odd ones out
+def convert_row(row: list, schema: list) -> list:
+    # with a cached schema nothing gets raised, so rows that fit are one comprehension
+    if len(row) <= len(schema):
+        try:
+            return [convert(value) for convert, value in zip(schema, row)]
+        except ValueError:
+            pass
+
+    values = []
+    for index, value in enumerate(row):
+        try:
+            values.append(schema[index](value))
+        except (ValueError, IndexError):
+            values.append(app_value_clean(value, iteration=index))
+    return values
+
+# How many of a column's values are different from each other, from 0 to 1
+def distinct_share(column) -> float:
+    return len(set(column)) / len(column) if column else 0
+
+# Columns that look like categories in the sample (all text, with each value turning
+# up at least twice on average), so they can be dictionary encoded while parsing
+def category_columns(sample: list, schema: list) -> list:
+    converted = [convert_row(row, schema) for row in sample]
+    return [index for index, column in enumerate(zip(*converted))
+            if all(type(value) is str for value in column) and distinct_share(column) <= 0.5]
+
+# Swaps each category column's value in the row for its builder's shared copy
+def encode_categories(values: list, builders: list):
+    for index, builder in builders:
+        if index < len(values):
+            values[index] = builder.add(values[index])
+        else:
+            builder.mixed = True
+
+def built_categories(headers, builders: list) -> dict:
+    columns = {headers[index]: builder.column() for index, builder in builders}
+    return {header: column for header, column in columns.items() if column is not None}
 
 # Useful when displaying a date, and keeping format consistent
 def convert_date_to_string(date: datetime):
     return datetime.strftime(date, "%d/%m/%Y")
 
-# Will open the data and process it into a format I can manipulate
-def open_data(file, headers=True):
+# Apps with Asian (CJK) characters in them get left out of the analysis
+RE_CJK = re.compile("[\u31c0-\u9fff]")
+
+# Used to use a lookahead regex for this, but it rescans the rest of the line
+# for every comma it finds, which is quadratic per row. Splitting on every comma
+# and gluing back together any pieces that sit inside quotes does it in one pass.
+# Quotes are kept on the fields since app_value_clean uses them to spot
+# install counts and dates
+def split_row(line: str) -> list:
+    fields = []
+    pieces = line.split(",")
+    field = pieces[0]
+    quotes = field.count('"')
+
+    for piece in pieces[1:]:
+        # odd number of quotes means we're still inside a quoted field
+        if quotes % 2:
+            field += "," + piece
+        else:
+            fields.append(field)
+            field = piece
+            quotes = 0
+        quotes += piece.count('"')
+
+    fields.append(field)
+    return fields
+
+# Generator that streams records out of an open file one at a time, so the
+# whole file never has to sit in memory. Skips the apps we don't want.
+# If given a Timings, it counts the rows and bytes it gets through as it goes,
+# and how long was spent reading lines compared to splitting them up
+def iter_rows(f, timings: Timings = None):
+    read = split = 0.0
+    record = ""
+    started = perf_counter()
+    try:
+        for line in f:
+            record += line
+            # a quoted field has a newline in it, so the record carries on
+            if record.count('"') % 2:
+                continue
+
+            line, record = record, ""
+            now = perf_counter()
+            read += now - started
+
+            if timings is not None:
+                timings.bytes += len(line) if line.isascii() else len(line.encode("utf-8"))
+
+            if RE_CJK.search(line) or "Varies with device" in line:
+                started = perf_counter()
+                split += started - now
+                continue
+
+            row = split_row(line.strip())
+            split += perf_counter() - now
+            if timings is not None:
+                timings.rows += 1
+
+            yield row
+            started = perf_counter()
+    finally:
+        if timings is not None:
+            timings.add("read", read)
+            timings.add("split", split)
+
+# offset, duplicate and first_index let it pick up where a previous read of the
+# same file left off (for when rows have just been added to the end of it).
+# If a stats dict is passed in, it gets filled in with how many rows were read,
+# and a Timings gets how long each stage took.
+# Columns that look like categories get dictionary encoded as the rows go by, so
+# every row shares one copy of each string, and if a categories dict is passed in
+# it gets the finished CategoryColumns to build an AppTable with
+@instrument(rows="result")
+def open_data(file, headers=True, offset=0, duplicate=None, first_index=0, stats=None,
+              timings: Timings = None, categories: dict = None):
+    output = {}
+    duplicate = set() if duplicate is None else duplicate
+    dup_count = 0
+    app_index = first_index - 1
+    clean = dedupe = 0.0
+
     # open the file with utf-8 encoding
     with open(file, "r", encoding="utf-8") as f:
         
         # If declared headers, use them as keys
         if headers:
-            _headers = re.split(",", f.readline())
+            _headers = f.readline().rstrip("\n").split(",")
             _headers = [item.replace(" ", "_").lower() for item in _headers]
-            if _headers[-1].endswith("\n"):
-                _headers[-1] = _headers[-1][:-1]
-            
+            # Google's data doesn't have an id so the row number is used instead
+            new_id = "id" not in _headers
+            if new_id:
+                _headers += ["id"]
+
+        if offset:
+            f.seek(offset)
+
+        # This used to generate a namedtuple. However, this was taking up a lot of time,
+        # and also required dill. This way I can use pickle to speed it up a little
+
+        # Cycle through apps in file, adding each to the dictionary using headers as keys
+        # Each value must be checked and converted to int, float, or date
+        rows = iter_rows(f, timings)
+        sample = list(islice(rows, SCHEMA_SAMPLE_ROWS))
+        started = perf_counter()
+        schema = infer_schema(sample)
+        if headers and new_id:
+            schema.append(keep_value)
+        builders = [(index, CategoryBuilder()) for index in category_columns(sample, schema)]
+        schema = cached_schema(schema, sample)
+        clean += perf_counter() - started
+
+        for app_index, _app in enumerate(chain(sample, rows), first_index):
+            started = perf_counter()
+            if _app[0] in duplicate:
+                dup_count += 1
+                dedupe += perf_counter() - started
+                continue
+            duplicate.add(_app[0])
+            checked = perf_counter()
+            dedupe += checked - started
+
+            if headers and new_id:
+                _app += [app_index]
+
+            values = convert_row(_app, schema)
+            encode_categories(values, builders)
+            if headers:
+                App = dict(zip(_headers, values))
+            else:
+                # if no headers, the key is just the index of the column
+                App = dict(enumerate(values))
+
+            # Add to dict
+            output[App['id']] = App
+            clean += perf_counter() - checked
+        
+    print(f"Removed {dup_count} duplicate rows from {os.path.basename(file)}")
+
+    if timings is not None:
+        timings.add("clean", clean)
+        timings.add("dedupe", dedupe)
+
+    if categories is not None:
+        categories.update(built_categories(_headers if headers else range(len(schema)), builders))
+
+    if stats is not None:
+        stats["rows"] = app_index + 1
+        stats["duplicates"] = dup_count
+        stats["conversion"] = conversion_stats(_headers if headers else range(len(schema)), schema)
             
-        read_file = f.readlines()
-    
+    return output
+
+# Splits the file from start onwards into pieces of roughly chunk_bytes, each ending
+# at the end of a line. A newline inside a quoted field isn't the end of a record,
+# so the quotes are counted on the way and a cut only happens when they're even
+def chunk_boundaries(file, start: int, chunk_bytes: int) -> list:
+    import mmap
+
+    size = os.path.getsize(file)
+    bounds = [start]
+    if size <= start:
+        return bounds + [start]
+
+    with open(file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        position = start
+        while position + chunk_bytes < size:
+            cut = position + chunk_bytes
+            inside_quotes = data[position:cut].count(b'"') % 2
+            newline = data.find(b"\n", cut)
+
+            while newline != -1:
+                inside_quotes ^= data[cut:newline].count(b'"') % 2
+                if not inside_quotes:
+                    break
+                cut = newline
+                newline = data.find(b"\n", newline + 1)
+
+            if newline == -1:
+                break
+            position = newline + 1
+            bounds.append(position)
+
+    if bounds[-1] != size:
+        bounds.append(size)
+    return bounds
+
+# What each worker process runs - parses and cleans one piece of the file on its own.
+# Hands back how many records it read along with the ones that weren't duplicates
+# (within this piece), where each one was so the row numbers can be worked out after,
+# how its conversion caches did, and which columns look like categories
+def _parse_chunk(file, start: int, end: int):
+    import io
+
+    timings = Timings()
+    with timings.stage("read"):
+        with open(file, "rb") as f:
+            f.seek(start)
+            text = f.read(end - start).decode("utf-8")
+
+    rows = iter_rows(io.StringIO(text, newline=None), timings)
+    sample = list(islice(rows, SCHEMA_SAMPLE_ROWS))
+    with timings.stage("clean"):
+        schema = infer_schema(sample)
+        category_indexes = category_columns(sample, schema)
+        schema = cached_schema(schema, sample)
+
+    seen = set()
+    parsed = []
+    count = 0
+    clean = 0.0
+    for index, _app in enumerate(chain(sample, rows)):
+        count += 1
+        if _app[0] in seen:
+            continue
+        seen.add(_app[0])
+        started = perf_counter()
+        parsed.append((index, _app[0], convert_row(_app, schema)))
+        clean += perf_counter() - started
+    timings.add("clean", clean)
+
+    return count, parsed, timings, conversion_stats(range(len(schema)), schema), category_indexes
+
+# Same as open_data, but the file gets split into chunks that are parsed in separate
+# processes. The results are put back together in file order, so which duplicate
+# gets kept (the first one) and Google's made up ids come out exactly the same.
+# Anything calling this needs an if __name__ == "__main__" guard, since on some
+# systems the worker processes import the main script again.
+# The stage times in timings are added up across all the workers
+@instrument(rows="result")
+def open_data_parallel(file, workers=None, chunk_bytes=None, stats=None,
+                       timings: Timings = None, categories: dict = None):
+    from concurrent.futures import ProcessPoolExecutor
 
-    # I'm not very good at regex, so I got ChatGPT to write this expression for me,
-    # it works for both Apple and Google datasets which is nice.
-    # Here's the breakdown:
-    # , - Matches a comma character.
-    # (?=- Positive lookahead assertion. This is a zero-width assertion that matches a comma only if it is followed by the pattern that follows the=sign.
-    # (?: - Non-capturing group. This group is used for grouping multiple expressions together without capturing the matched text.
-    # (?: [ ^ "]*"){2} - Matches any number of characters that are not double-quotes, followed by a double-quote character, and repeats this pattern twice.
-    # ) * - Matches the previous group zero or more times.
-    # [ ^"] * - Matches any number of characters that are not double-quotes.
-    # $ - Matches the end of the string.
-    read_file = [re.split(r',(?=(?:(?:[^"]*"){2})*[^"]*$)', item.strip()) 
-                    for item in read_file 
-                    # exclude any with Asian (CJK) characters
-                    if not re.findall("[\u31c0-\u9fff]", "".join(item))
-                    and "Varies with device" not in item
-                    ]
-    """ don't need anymore since ?: indicates non-capturing groups 
-    for i in range(len(read_file)):
-        read_file[i] = [j for j in read_file[i] if j != ","] """
-    """ also no longer needed as item.strip() removes whitespace including \\n 
-        if _app[-1].endswith("\n"):
-            _app[-1] = _app[-1][:-1] """
-    
     output = {}
     duplicate = set()
     dup_count = 0
 
-    # This used to generate a namedtuple. However, this was taking up a lot of time,
-    # and also required dill. This way I can use pickle to speed it up a little
+    with open(file, "rb") as f:
+        header_line = f.readline()
+    _headers = header_line.decode("utf-8").rstrip("\r\n").split(",")
+    _headers = [item.replace(" ", "_").lower() for item in _headers]
+    new_id = "id" not in _headers
+    if new_id:
+        _headers += ["id"]
+
+    workers = workers or os.cpu_count() or 1
+    if chunk_bytes is None:
+        # a few chunks per worker so one slow chunk doesn't hold everything up
+        chunk_bytes = max(os.path.getsize(file) // (workers * 4), MIN_CHUNK_BYTES)
+    bounds = chunk_boundaries(file, len(header_line), chunk_bytes)
+
+    timings = timings if timings is not None else Timings()
+    base = 0
+    conversion = {}
+    # the categories get encoded here, as the chunks are put back together, going by
+    # which columns looked like categories in the first chunk
+    builders = None
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for count, parsed, chunk_timings, chunk_conversion, category_indexes in executor.map(
+                _parse_chunk, repeat(file), bounds[:-1], bounds[1:]):
+            timings.merge(chunk_timings)
+            if builders is None:
+                builders = [(index, CategoryBuilder()) for index in category_indexes]
+            merge_conversion_stats(conversion, {_headers[index]: counts for index, counts in chunk_conversion.items()})
+            started = perf_counter()
+            for index, key, values in parsed:
+                if key in duplicate:
+                    dup_count += 1
+                    continue
+                duplicate.add(key)
+
+                encode_categories(values, builders)
+                if new_id:
+                    values.append(base + index)
+                App = dict(zip(_headers, values))
+                output[App['id']] = App
+
+            # the ones the worker already knew were duplicates
+            dup_count += count - len(parsed)
+            base += count
+            timings.add("dedupe", perf_counter() - started)
 
-    # Cycle through apps in file, adding each to the dictionary using headers as keys
-    # Each value must be checked and converted to int, float, or date
-    for app_index, _app in enumerate(read_file):
-        if _app[0] in duplicate:
-            dup_count += 1
-            continue
+    print(f"Removed {dup_count} duplicate rows from {os.path.basename(file)}")
 
-        vals = []
-        if headers:
-            if "id" not in _headers:
-                _headers += ["id"]
-                _new_id = True
-            if "_new_id" in locals():
-                _app += [app_index]
-            App = {}
+    if stats is not None:
+        stats["rows"] = base
+        stats["duplicates"] = dup_count
+        stats["conversion"] = conversion
+
+    if categories is not None:
+        categories.update(built_categories(_headers, builders or []))
 
-            for index, header in enumerate(_headers):
-                app_value_clean(_app[index], vals, index)
-                App[header] = vals[-1]
-        else:
-            # if no headers, the key is just the index of the column
-            App = {}
-            for index, value in enumerate(_app):
-                app_value_clean(value, vals, index)
-                App[index] = vals[-1]
-
-        # Add to dict
-        output[App['id']] = App
-        duplicate.add(_app[0])
-        
-    print(f"Removed {dup_count} duplicate rows from {os.path.basename(file)}")
-            
     return output
 
-# This code drives the above function ONLY if it can't be retrieved from a pickle file
-def load_save_data(path) -> dict:
+# Re-reads just the rows that have been added to the end of the CSV since the cache
+# was made, and tacks them onto the cached table
+@instrument(rows="result")
+def append_new_rows(table: AppTable, csv_file, manifest: dict, stats: dict,
+                    timings: Timings = None) -> AppTable:
+    # The first column is what duplicates are spotted by. It's been cleaned since,
+    # so turn it back into text the way it would have been read
+    first = table.headers[0]
+    duplicate = {value if isinstance(value, str) else str(value) for value in table.columns[first]}
+
+    new_apps = open_data(csv_file, offset=manifest["size"], duplicate=duplicate,
+                         first_index=manifest["rows"], stats=stats, timings=timings)
+
+    rows = [list(row.values()) for row in table.rows()]
+    rows += [list(app.values()) for app in new_apps.values()]
+    return AppTable.from_rows(table.headers, rows, table.key)
+
+# The cache at path, and whether it's "fresh", "appended", "stale" or "missing" next
+# to its CSV (see source_status).
+# Used to be a pickle, but that meant unpickling the whole thing before doing anything.
+# The cache is memory-mapped now (see cache.py) so there's nothing to wait for here,
+# columns only get read off disk when they're first used.
+# The cache remembers what the CSV looked like when it was made, so it only gets
+# rebuilt if the CSV (or the way it's parsed) has changed since
+def cache_status(path, timings: Timings = None) -> tuple:
+    from cache import CacheError, read_cache, source_status
+
     csv_file = os.path.splitext(path)[0] + ".csv"
-    # I HAVE THEM SAVED thanks to pickle :) better than pickle in that it'll save namedtuples to a .pickle file :)
-    # Did try using gzip to speed up serialisation but while it saved on space, it actually slowed the retrieval
-    if os.path.exists(path):
-
-        # Prime for threading
-        def open_file(path, queue: Queue):
-            with open(path, "rb") as file:
-                output = pickle.load(file)
-                queue.put(output)
-
-        output_queue = Queue()
-        custom_thread((show_progress, (f"Fetching {path}",)), (open_file, (path, output_queue)))
-        open_file(path, output_queue)
-        output = output_queue.get()
-        
-        print(f"File loaded: {len(output)} items with {len(output[list(output.keys())[0]])} traits each\n")
+    timings = timings if timings is not None else Timings()
+    try:
+        with timings.stage("cache"):
+            output = read_cache(path)
+            return output, source_status(output.manifest, csv_file, PARSER_VERSION)
+    except (FileNotFoundError, CacheError):
+        return None, "missing"
+
+# This code drives the above function ONLY if it can't be retrieved from the cache file
+# columnar=True hands back an AppTable instead, which looks the same from the
+# outside but holds each field as one typed column (much less memory).
+# workers=N parses a CSV that needs (re)building across N processes.
+# Pass in a Timings to get back how long each stage took, for logging
+@instrument(rows="result")
+def load_save_data(path, columnar=False, workers=None, timings: Timings = None) -> dict:
+    csv_file = os.path.splitext(path)[0] + ".csv"
+    timings = timings if timings is not None else Timings()
+    timings.label = timings.label or os.path.basename(csv_file)
+    output, status = cache_status(path, timings)
+
+    if status == "fresh":
+        print(f"File loaded: {len(output)} items with {len(output.headers)} traits each\n")
+
+        if not columnar:
+            with timings.stage("rows"):
+                output = {key: dict(row) for key, row in output.items()}
+        return output
+
+    stats = {}
+    if status == "appended":
+        print(f"{os.path.basename(csv_file)} has new rows, adding them to the cache")
+        with Progress("Adding rows", timings):
+            table = append_new_rows(output, csv_file, output.manifest["source"], stats, timings)
+        # let go of the old cache so it can be written over
+        output.close()
+        output = None
 
     else:
-        print("No .pickle found, generating data")
-        
-        output_queue = Queue()
-        def gen_output(file, queue: Queue):
-            output = open_data(file)
-            queue.put(output)
-
-        custom_thread((show_progress, ("Generating",)), 
-                      (gen_output, (csv_file, output_queue)))
-        # Retrieve dataset from queue
-        output = output_queue.get() 
-        del output_queue
-
-        def dump_output(path, output):
-            with open(path, "wb") as dump:
-                # Highest protocol is fastest and smallest file size
-                pickle.dump(output, dump, protocol=pickle.HIGHEST_PROTOCOL)
-        
-        custom_thread((show_progress, ("Serialising",)), 
-                      (dump_output, (path, output)))
-        dump_output(path, output)
-
-        print(path, "Serialised using pickle protocol", pickle.HIGHEST_PROTOCOL, "\n")
+        print("No cache found, generating data" if status == "missing"
+              else f"{os.path.basename(csv_file)} has changed, generating data")
+        if output is not None:
+            output.close()
+
+        categories = {}
+        with Progress("Generating", timings):
+            if workers:
+                output = open_data_parallel(csv_file, workers, stats=stats, timings=timings,
+                                            categories=categories)
+            else:
+                output = open_data(csv_file, stats=stats, timings=timings, categories=categories)
+
+        with timings.stage("columns"):
+            table = AppTable.from_dict(output, built=categories)
+
+    # Fields with several values in (like genres) get split up now, so nothing after
+    # has to split the strings. These and the indexes get saved along with the cache
+    # so they don't need building every time
+    with timings.stage("indexes"):
+        table.columns.update(split_columns(table))
+        table.indexes = build_indexes(table)
+
+    from cache import fingerprint, write_cache
+
+    manifest = {"parser_version": PARSER_VERSION, "source": fingerprint(csv_file, stats["rows"])}
+    with Progress("Serialising"), timings.stage("serialise"):
+        write_cache(table, path, manifest)
+
+    print(path, "Serialised as a columnar cache")
+    print(timings)
+    if stats.get("conversion"):
+        print("Conversion caches:")
+        print_conversion_stats(stats["conversion"])
+    print()
+
+    if columnar:
+        output = table
+    elif output is None:
+        output = {key: dict(row) for key, row in table.items()}
     
     return output
 
+# The shared rows/bytes counters for the loads going on in this process (see load_many)
+_load_counters = None
+
+def _start_loader(counters):
+    global _load_counters
+    _load_counters = counters
+
+# What each load_many worker process runs - rebuilds one cache, and hands back what it
+# would have printed so it doesn't get mixed up with the progress line
+def _rebuild(path, slot: int, workers=None) -> str:
+    import contextlib, io
+
+    timings = SharedTimings(_load_counters, slot)
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        load_save_data(path, columnar=True, workers=workers, timings=timings)
+    return output.getvalue()
+
+def _name(path) -> str:
+    return os.path.splitext(os.path.basename(path))[0]
+
+# Loads (or rebuilds) several datasets at once, handing back {path: Future} straight
+# away so the analysis can start on whichever one is ready first. Caches that are
+# up to date get read in threads (they're memory-mapped so there's hardly anything
+# to it), and any that need a CSV parsing get rebuilt in processes of their own, so
+# one dataset's parse doesn't hold the others up. Progress for all of them is shown
+# on one line. workers is passed on for parsing each CSV in parallel too.
+# Anything calling this needs an if __name__ == "__main__" guard, like open_data_parallel
+def load_many(paths, columnar=True, workers=None, stream=None) -> dict:
+    import multiprocessing, threading
+    from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+    from cache import read_cache
+
+    paths = list(dict.fromkeys(paths))
+    futures = {path: Future() for path in paths}
+    board = ProgressBoard(stream=stream)
+    remaining = [len(paths)]
+    lock = threading.Lock()
+
+    def convert(table):
+        return table if columnar else {key: dict(row) for key, row in table.items()}
+
+    def finished(path, result=None, error=None, output=""):
+        board.finish(_name(path), output, failed=error is not None)
+        if error is None:
+            futures[path].set_result(result)
+        else:
+            futures[path].set_exception(error)
+        with lock:
+            remaining[0] -= 1
+            if not remaining[0]:
+                board.stop()
+
+    statuses = {path: cache_status(path) for path in paths}
+    warm = [path for path in paths if statuses[path][1] == "fresh"]
+    cold = [path for path in paths if statuses[path][1] != "fresh"]
+    board.start()
+
+    def read_warm(path):
+        try:
+            finished(path, convert(statuses[path][0]))
+        except Exception as error:
+            finished(path, error=error)
+
+    def read_rebuilt(path, future):
+        try:
+            output = future.result()
+            finished(path, convert(read_cache(path)), output=output)
+        except Exception as error:
+            finished(path, error=error)
+
+    if cold:
+        # the old caches get rebuilt by swapping a new file in, which can't happen
+        # (on Windows) while they're still mapped here
+        for path in cold:
+            table, status = statuses[path]
+            if table is not None:
+                table.close()
+            statuses[path] = (None, status)
+        counters = multiprocessing.Array("q", 2 * len(cold), lock=False)
+        processes = ProcessPoolExecutor(min(len(cold), os.cpu_count() or 1),
+                                        initializer=_start_loader, initargs=(counters,))
+        for slot, path in enumerate(cold):
+            board.add(_name(path), SharedTimings(counters, slot, _name(path)))
+            future = processes.submit(_rebuild, path, slot, workers)
+            future.add_done_callback(partial(read_rebuilt, path))
+        # carries on with what's been submitted, it just won't take anything else
+        processes.shutdown(wait=False)
+
+    if warm:
+        threads = ThreadPoolExecutor(len(warm))
+        for path in warm:
+            board.add(_name(path))
+            threads.submit(read_warm, path)
+        threads.shutdown(wait=False)
+
+    return futures
+
 # Makes it easy to retrieve the information we can see in the apps, depending on store
 def display_fields(apps: dict):
     print(f"fields accessible through {retrieve_name(apps)[0]}:")
@@ -235,43 +791,200 @@ def display_fields(apps: dict):
         print(item)
 
 def freq_table(dataset: dict, attr: str):
-    table = {}
+    return freq_tables(dataset, [attr])[attr.lower()]
+
+# Frequency tables (as percentages) for several attributes at once, so the dataset
+# only gets walked through the once rather than once per attribute.
+# On an AppTable each column is counted on its own, without going through the rows.
+# top=k keeps just the k most common values of each, without sorting the whole table
+@instrument(rows="input")
+def freq_tables(dataset: dict, attrs: list, top=None) -> dict:
+    attrs = [attr.lower() for attr in attrs]
     total = len(dataset)
 
-    for item in dataset.values():
-        value = item[attr.lower()]
-        if value in table:
-            table[value] += 1
-        else:
-            table[value] = 1
+    if isinstance(dataset, AppTable):
+        counts = {attr: value_counts(dataset.columns[attr]) for attr in attrs}
+    else:
+        counts = {attr: {} for attr in attrs}
+        tables = list(counts.items())
+        for item in dataset.values():
+            for attr, table in tables:
+                value = item[attr]
+                table[value] = table.get(value, 0) + 1
 
-    return {key: round((value/total)*100, 5) for key, value in table.items()}
+    output = {}
+    for attr, table in counts.items():
+        if top is not None:
+            table = dict(heapq.nlargest(top, table.items(), key=lambda x: x[1]))
+        output[attr] = {key: round((value/total)*100, 5) for key, value in table.items()}
+    return output
 
-def display_freq_table(dataset: dict, attr="", reverse=True, is_freq_table=False):
+# top=k only shows the k biggest (or smallest, if reverse=False)
+def display_freq_table(dataset: dict, attr="", reverse=True, is_freq_table=False, top=None):
     
     if is_freq_table:
         table = dataset
     else:
-        table = freq_table(dataset, attr)
-        
-    sorted_table = sorted(table.items(), key=lambda x: x[1], reverse=reverse)
+        table = freq_tables(dataset, [attr])[attr.lower()]
+
+    if top is not None:
+        pick = heapq.nlargest if reverse else heapq.nsmallest
+        sorted_table = pick(top, table.items(), key=lambda x: x[1])
+    else:
+        sorted_table = sorted(table.items(), key=lambda x: x[1], reverse=reverse)
     for key, value in sorted_table:
         print(key, value, sep=": ")
 
-def average(store: dict, field, number_field):
+# Running totals for one group of one numerical field
+class Aggregate:
+    __slots__ = ("rows", "count", "sum", "min", "max", "values")
+
+    def __init__(self, keep_values=False):
+        self.rows = 0
+        self.count = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+        # only kept if the median or standard deviation are wanted
+        self.values = [] if keep_values else None
+
+    def add(self, value, counts: bool):
+        self.rows += 1
+        if not counts:
+            return
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        if self.values is not None:
+            self.values.append(value)
+
+    def merge(self, other: "Aggregate"):
+        self.rows += other.rows
+        self.count += other.count
+        self.sum += other.sum
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+        if self.values is not None:
+            self.values += other.values
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else None
+
+    @property
+    def median(self):
+        import statistics
+        return statistics.median(self.values) if self.values else None
+
+    @property
+    def std(self):
+        import statistics
+        return statistics.pstdev(self.values) if self.values else None
+
+    def as_dict(self) -> dict:
+        output = {"rows": self.rows, "count": self.count, "sum": self.sum,
+                  "mean": self.mean, "min": self.min, "max": self.max}
+        if self.values is not None:
+            output["median"] = self.median
+            output["std"] = self.std
+        return output
+
+    def __repr__(self):
+        return f"Aggregate({self.as_dict()})"
+
+# Works out count, sum, mean, min and max (plus median/std if asked for in extra) of
+# each numerical field, for every group of each field, in one go. Every group gets
+# its totals added to as the rows go by, rather than the whole store being filtered
+# again for each group. Several fields can be grouped by in the same pass.
+# floats_only=True only counts float values (ints, "NaN" etc. are left out but the
+# row still counts towards rows), like average always has.
+# key is applied to each group's value, like str so 1 and "1" end up together.
+# Gives back {field: {group: {number_field: Aggregate}}}
+@instrument(rows="input")
+def group_by(store: dict, fields, number_fields, extra=(), floats_only=True, key=None) -> dict:
+    fields = [fields] if isinstance(fields, str) else list(fields)
+    number_fields = [number_fields] if isinstance(number_fields, str) else list(number_fields)
+    keep_values = "median" in extra or "std" in extra
+
+    if floats_only:
+        counts = lambda value: type(value) is float
+    else:
+        counts = lambda value: type(value) in (int, float)
+
+    # Get everything into columns first, so each field is only read the once
+    if isinstance(store, AppTable):
+        group_columns = {}
+        number_columns = [list(store.columns[number_field]) for number_field in number_fields]
+        for field in fields:
+            column = store.columns[field]
+            # group category columns on their codes and only look the names up at the end
+            if isinstance(column, CategoryColumn):
+                group_columns[field] = (column.codes, column.categories, number_columns)
+            # a row with several values (like genre) counts towards each of them, so its
+            # numbers get lined up with every one of its codes
+            elif isinstance(column, MultiValueColumn):
+                rows = column.row_ids()
+                group_columns[field] = (column.codes, column.categories,
+                                        [[numbers[row] for row in rows] for numbers in number_columns])
+            else:
+                group_columns[field] = (column, None, number_columns)
+    else:
+        number_columns = [[] for _ in number_fields]
+        group_columns = {field: ([], None, number_columns) for field in fields}
+        for item in store.values():
+            for field in fields:
+                group_columns[field][0].append(item[field])
+            for number_field, column in zip(number_fields, number_columns):
+                column.append(item[number_field])
+
+    output = {}
+    for field, (groups, names, numbers) in group_columns.items():
+        aggregates = {}
+        for group, *values in zip(groups, *numbers):
+            per_field = aggregates.get(group)
+            if per_field is None:
+                per_field = aggregates[group] = [Aggregate(keep_values) for _ in number_fields]
+            for aggregate, value in zip(per_field, values):
+                aggregate.add(value, counts(value))
+
+        table = {}
+        for group, per_field in aggregates.items():
+            if names is not None:
+                group = names[group]
+            if key is not None:
+                group = key(group)
+
+            if group in table:
+                for aggregate, other in zip(table[group].values(), per_field):
+                    aggregate.merge(other)
+            else:
+                table[group] = dict(zip(number_fields, per_field))
+        output[field] = table
+
+    return output
+
+# groups can be passed in from a group_by that's already been done (with key=str),
+# so a few averages can come out of the same pass through the store.
+# floats_only=False counts ints too, for whole-number fields like installs
+@instrument(rows="input")
+def average(store: dict, field, number_field, groups=None, floats_only=True):
+    if groups is None:
+        groups = group_by(store, field, number_field, floats_only=floats_only, key=str)[field]
+
     # Unique items, no repeats
-    fields = sorted(set([str(item[field])
-                 for item in store.values()]))
+    fields = sorted(groups)
     averages = []
 
     for _field in fields:
-        # find average number of numerical field
-        subset = {key: value for key, value in store.items() if str(
-            value[field]) == _field}
-        total = sum([value[number_field]
-                    for value in subset.values()
-                    if isinstance(value[number_field], float)])
-        avg = round(total / (len(subset) or 1), 2)
+        # the total only includes floats (unless floats_only=False), but it's averaged
+        # over every app in the group
+        aggregate = groups[_field][number_field]
+        avg = round(aggregate.sum / (aggregate.rows or 1), 2)
         print(_field, avg, sep=" : ")
         averages.append(avg)
     
@@ -0,0 +1,225 @@
+# Indexes over the loaded app data, so questions like "all paid apps in GAME with a
+# rating over 4.5" don't need a full scan of every app each time they're asked.
+# Categorical columns get a hash index (value -> the rows holding it) and numerical
+# ones get a sorted index (rows in order of value) that ranges can be cut out of.
+# A query is a list of conditions that all have to hold - the indexed ones are
+# looked up and intersected (smallest first), and anything left over is checked
+# against just the rows that made it that far
+import operator
+from bisect import bisect_left, bisect_right
+
+from columnar import AppTable, CategoryColumn, MultiValueColumn, Row, as_buffer, get_column, get_headers
+from instrument import instrument
+
+DEFAULT_HASH_INDEXES = ("category", "prime_genre", "cont_rating", "type", "genre")
+DEFAULT_SORTED_INDEXES = ("rating", "user_rating", "price", "installs", "size")
+
+OPERATORS = {"==": operator.eq, "!=": operator.ne, "<": operator.lt, "<=": operator.le,
+             ">": operator.gt, ">=": operator.ge, "in": lambda value, options: value in options}
+
+
+# value -> rows, stored as every row grouped by value one after the other,
+# with offsets saying where each value's rows start and end
+class HashIndex:
+    kind = "hash"
+
+    def __init__(self, values: list, offsets, rows):
+        self.values = values
+        self.offsets = as_buffer("I", offsets)
+        self.rows = as_buffer("I", rows)
+        self._positions = {value: position for position, value in enumerate(values)}
+
+    @classmethod
+    def build(cls, column):
+        buckets = {}
+        # group category columns by code, it's quicker than hashing the strings
+        if isinstance(column, CategoryColumn):
+            for row, code in enumerate(column.codes):
+                buckets.setdefault(code, []).append(row)
+            buckets = {column.categories[code]: rows for code, rows in buckets.items()}
+        # a row with several values goes under each of them
+        elif isinstance(column, MultiValueColumn):
+            for code, row in zip(column.codes, column.row_ids()):
+                buckets.setdefault(code, []).append(row)
+            buckets = {column.categories[code]: rows for code, rows in buckets.items()}
+        else:
+            for row, value in enumerate(column):
+                buckets.setdefault(value, []).append(row)
+
+        offsets, rows = [0], []
+        for value_rows in buckets.values():
+            rows += value_rows
+            offsets.append(len(rows))
+        return cls(list(buckets), offsets, rows)
+
+    def lookup(self, value):
+        position = self._positions.get(value)
+        if position is None:
+            return self.rows[0:0]
+        return self.rows[self.offsets[position]:self.offsets[position + 1]]
+
+    def count(self, value) -> int:
+        return len(self.lookup(value))
+
+    # Only values that could be looked up count. Anything else (a list for ==, or a
+    # string for in, which means a substring check) is left for query to compare
+    def supports(self, op: str, value) -> bool:
+        if op == "==":
+            return _hashable(value)
+        if op == "in":
+            if isinstance(value, (str, bytes)):
+                return False
+            try:
+                return all(_hashable(option) for option in value)
+            except TypeError:
+                return False
+        return False
+
+    def match(self, op: str, value):
+        if op == "==":
+            return self.lookup(value)
+        rows = []
+        for option in value:
+            rows += self.lookup(option)
+        return rows
+
+
+# Rows in order of their (numerical) value, with the values alongside to binary search.
+# Anything that isn't a number (like Google's "NaN" ratings) isn't in it
+class SortedIndex:
+    kind = "sorted"
+
+    def __init__(self, keys, rows):
+        self.keys = as_buffer("d", keys)
+        self.rows = as_buffer("I", rows)
+
+    @classmethod
+    def build(cls, column):
+        pairs = sorted((float(value), row) for row, value in enumerate(column)
+                       if type(value) in (int, float))
+        return cls([key for key, _ in pairs], [row for _, row in pairs])
+
+    def range(self, low=None, high=None, include_low=True, include_high=True):
+        start = 0 if low is None else (bisect_left if include_low else bisect_right)(self.keys, low)
+        end = len(self.keys) if high is None else (bisect_right if include_high else bisect_left)(self.keys, high)
+        return self.rows[start:max(start, end)]
+
+    # Only numbers are in it, so anything else (like "NaN") has to be compared the long way
+    def supports(self, op: str, value) -> bool:
+        return (op in ("==", "<", "<=", ">", ">=") and type(value) in (int, float)
+                and value == value)
+
+    def match(self, op: str, value):
+        if op == "==":
+            return self.range(value, value)
+        if op in ("<", "<="):
+            return self.range(high=value, include_high=op == "<=")
+        return self.range(low=value, include_low=op == ">=")
+
+
+# Any of the default columns the store actually has get indexed
+@instrument(rows="input")
+def build_indexes(store, hash_columns=DEFAULT_HASH_INDEXES, sorted_columns=DEFAULT_SORTED_INDEXES) -> dict:
+    # an AppTable can have columns split out of others too, like genre
+    headers = list(store.columns) if isinstance(store, AppTable) else get_headers(store)
+    indexes = {}
+    for name in hash_columns:
+        if name in headers:
+            indexes[name] = HashIndex.build(get_column(store, name))
+    for name in sorted_columns:
+        if name in headers:
+            indexes[name] = SortedIndex.build(get_column(store, name))
+    return indexes
+
+
+# Every app matching all the conditions, in the order they're stored. Conditions look
+# like ("category", "==", "GAME") or ("rating", ">", 4.5), and the operators are
+# ==, !=, <, <=, >, >= and in. Uses the store's own indexes (an AppTable from the
+# cache comes with them) unless some are passed in
+@instrument(rows="result")
+def query(store, conditions: list, indexes=None) -> list:
+    if indexes is None:
+        indexes = getattr(store, "indexes", None) or {}
+
+    for _, op, _ in conditions:
+        if op not in OPERATORS:
+            raise KeyError(f"Valid operators are: {list(OPERATORS)}")
+
+    indexed = [(name, op, value) for name, op, value in conditions
+               if name in indexes and indexes[name].supports(op, value)]
+    leftover = [condition for condition in conditions if condition not in indexed]
+
+    # Look up each indexed condition, and intersect starting from the smallest
+    matches = sorted((indexes[name].match(op, value) for name, op, value in indexed), key=len)
+    if matches:
+        rows = set(matches[0])
+        for match in matches[1:]:
+            if not rows:
+                break
+            rows.intersection_update(match)
+    else:
+        rows = range(len(store))
+
+    # Whatever couldn't use an index only gets checked on the rows still in the running
+    for name, op, value in leftover:
+        column = get_column(store, name)
+        if isinstance(column, (CategoryColumn, MultiValueColumn)) and op in CODE_OPERATORS:
+            rows = _match_codes(column, op, value, rows)
+            continue
+        compare = OPERATORS[op]
+        rows = [row for row in rows if _compare(compare, column[row], value)]
+
+    rows = sorted(rows)
+    if isinstance(store, AppTable):
+        return [Row(store, row) for row in rows]
+    apps = list(store.values())
+    return [apps[row] for row in rows]
+
+
+CODE_OPERATORS = ("==", "!=", "in")
+
+def _hashable(value) -> bool:
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
+
+# ==, != and in on a category column only need the value(s) looked up once, and then
+# it's each row's code being compared rather than its string. A row of a multi-valued
+# column matches if any of its values do (and != if none of them do)
+def _match_codes(column, op: str, value, rows) -> list:
+    lookup = {category: code for code, category in enumerate(column.categories)}
+    options = value if op == "in" else [value]
+    wanted = set()
+    if op == "in" and isinstance(value, str):
+        # like "GAME" in "GAMES", the same as comparing the strings would do
+        options = [category for category in lookup if category in value]
+    elif op == "in" and not hasattr(value, "__iter__"):
+        # nothing is "in" a number, same as _compare
+        options = []
+    for option in options:
+        try:
+            if option in lookup:
+                wanted.add(lookup[option])
+        except TypeError:
+            # unhashable, so it can't be any of the categories
+            pass
+
+    codes = column.codes
+    if isinstance(column, MultiValueColumn):
+        offsets = column.offsets
+        having = {row for row in rows if not wanted.isdisjoint(codes[offsets[row]:offsets[row + 1]])}
+        return [row for row in rows if (row in having) != (op == "!=")]
+
+    if op == "!=":
+        return [row for row in rows if codes[row] not in wanted]
+    return [row for row in rows if codes[row] in wanted]
+
+
+# Comparing a number against something like "NaN" just means it doesn't match
+def _compare(compare, cell, value) -> bool:
+    try:
+        return compare(cell, value)
+    except TypeError:
+        return False
@@ -0,0 +1,229 @@
+# Lightweight, always-on timing for the functions in functions.py, so there's a
+# rough idea of where the time goes without running everything under cProfile
+# (which makes it all several times slower). Each call of an instrumented function
+# records its wall time, CPU time and how many rows it dealt with, plus its peak
+# memory if trace_memory() has been turned on (tracemalloc is slow, so it's off
+# by default). Totals per function are always kept, and the most recent calls are
+# kept as well so they can be written out as a Chrome trace (chrome://tracing or
+# https://ui.perfetto.dev). With disable() the decorators just call straight through
+#
+#   @instrument(rows="result")
+#   def open_data(...): ...
+#
+#   with span("plot") as record:
+#       record.rows = len(apps)
+#
+#   print(summary())
+#   write_chrome_trace("trace.json")
+import json, os, threading
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from time import perf_counter, process_time
+
+# How many individual calls are kept for the trace, the totals cover everything
+MAX_EVENTS = 100000
+
+# Set APP_STORE_INSTRUMENT=0 to start with it off
+ENABLED = os.environ.get("APP_STORE_INSTRUMENT", "1") != "0"
+
+
+# One call of something being timed
+class Record:
+    __slots__ = ("name", "start", "wall", "cpu", "rows", "peak", "thread", "_child_peak")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = self.wall = self.cpu = 0.0
+        self.rows = None
+        self.peak = None
+        self.thread = threading.get_ident()
+        self._child_peak = 0
+
+
+# Totals for every call of one thing
+class Stats:
+    __slots__ = ("calls", "wall", "cpu", "rows", "peak")
+
+    def __init__(self):
+        self.calls = 0
+        self.wall = self.cpu = 0.0
+        self.rows = None
+        self.peak = None
+
+    def add(self, record: Record):
+        self.calls += 1
+        self.wall += record.wall
+        self.cpu += record.cpu
+        if record.rows is not None:
+            self.rows = (self.rows or 0) + record.rows
+        if record.peak is not None:
+            self.peak = max(self.peak or 0, record.peak)
+
+
+class Recorder:
+    def __init__(self, enabled=ENABLED, max_events=MAX_EVENTS):
+        self.enabled = enabled
+        self.memory = False
+        self.stats = {}
+        self.events = deque(maxlen=max_events)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._epoch = perf_counter()
+
+    def _stack(self) -> list:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def start(self, name: str) -> Record:
+        record = Record(name)
+        # tracemalloc only gets imported once memory's being traced, it's slow to import
+        if self.memory:
+            import tracemalloc
+        if self.memory and tracemalloc.is_tracing():
+            # the peak is reset for every call, so whatever the call we're inside of
+            # had got up to so far gets saved first
+            stack = self._stack()
+            if stack:
+                stack[-1]._child_peak = max(stack[-1]._child_peak, tracemalloc.get_traced_memory()[1])
+            stack.append(record)
+            tracemalloc.reset_peak()
+            record._child_peak = tracemalloc.get_traced_memory()[0]
+            record.peak = record._child_peak
+        record.cpu = process_time()
+        record.start = perf_counter()
+        return record
+
+    def stop(self, record: Record):
+        record.wall = perf_counter() - record.start
+        record.cpu = process_time() - record.cpu
+        if record.peak is not None:
+            import tracemalloc
+            base = record.peak
+            record.peak = max(record._child_peak, tracemalloc.get_traced_memory()[1]) - base
+            stack = self._stack()
+            if stack and stack[-1] is record:
+                stack.pop()
+            # so the call we're inside of still counts our peak as part of its own
+            if stack:
+                stack[-1]._child_peak = max(stack[-1]._child_peak, base + record.peak)
+
+        with self._lock:
+            stats = self.stats.get(record.name)
+            if stats is None:
+                stats = self.stats[record.name] = Stats()
+            stats.add(record)
+            self.events.append(record)
+
+    def reset(self):
+        with self._lock:
+            self.stats.clear()
+            self.events.clear()
+            self._epoch = perf_counter()
+
+
+recorder = Recorder()
+
+
+def enable():
+    recorder.enabled = True
+
+def disable():
+    recorder.enabled = False
+
+# Peak memory per call as well. Noticeably slows everything down while it's on
+def trace_memory(on=True):
+    import tracemalloc
+
+    recorder.memory = on
+    if on and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    elif not on and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+@contextmanager
+def span(name: str):
+    if not recorder.enabled:
+        yield Record(name)
+        return
+    record = recorder.start(name)
+    try:
+        yield record
+    finally:
+        recorder.stop(record)
+
+
+def _count(value):
+    try:
+        return len(value)
+    except TypeError:
+        return None
+
+# Decorator that times every call of a function. rows can be "result" (how long
+# whatever it gives back is), "input" (how long its first argument is) or a function
+# that gets given the result
+def instrument(name=None, rows=None):
+    def decorator(func):
+        label = name or func.__name__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not recorder.enabled:
+                return func(*args, **kwargs)
+            record = recorder.start(label)
+            try:
+                result = func(*args, **kwargs)
+                if rows == "result":
+                    record.rows = _count(result)
+                elif rows == "input":
+                    record.rows = _count(args[0]) if args else None
+                elif rows is not None:
+                    record.rows = rows(result)
+                return result
+            finally:
+                recorder.stop(record)
+        return wrapper
+    return decorator
+
+
+# Totals per function as a plain dict, slowest first
+def summary_dict() -> dict:
+    with recorder._lock:
+        stats = sorted(recorder.stats.items(), key=lambda x: -x[1].wall)
+    return {name: {"calls": s.calls, "wall": round(s.wall, 6), "cpu": round(s.cpu, 6),
+                   "rows": s.rows, "peak": s.peak}
+            for name, s in stats}
+
+def summary() -> str:
+    lines = [f"{'name':<22} {'calls':>6} {'wall':>9} {'cpu':>9} {'rows':>10} {'rows/s':>10} {'peak':>9}"]
+    for name, s in summary_dict().items():
+        rate = f"{s['rows'] / s['wall']:,.0f}" if s["rows"] and s["wall"] else "-"
+        peak = f"{s['peak'] / 2 ** 20:.1f}MB" if s["peak"] is not None else "-"
+        lines.append(f"{name:<22} {s['calls']:>6} {s['wall']:>8.3f}s {s['cpu']:>8.3f}s "
+                     f"{s['rows'] if s['rows'] is not None else '-':>10} {rate:>10} {peak:>9}")
+    return "\n".join(lines)
+
+# The kept calls in Chrome's trace event format (complete "X" events, times in microseconds)
+def chrome_trace() -> dict:
+    pid = os.getpid()
+    with recorder._lock:
+        events = list(recorder.events)
+        epoch = recorder._epoch
+    trace = []
+    for record in events:
+        args = {"cpu_ms": round(record.cpu * 1000, 3)}
+        if record.rows is not None:
+            args["rows"] = record.rows
+        if record.peak is not None:
+            args["peak_bytes"] = record.peak
+        trace.append({"name": record.name, "ph": "X", "pid": pid, "tid": record.thread,
+                      "ts": round((record.start - epoch) * 1e6, 1),
+                      "dur": round(record.wall * 1e6, 1), "args": args})
+    return {"traceEvents": trace, "displayTimeUnit": "ms"}
+
+def write_chrome_trace(path):
+    with open(path, "w") as f:
+        json.dump(chrome_trace(), f)
@@ -0,0 +1,143 @@
+# Matching up the same app across the Google Play and App Store datasets. They don't
+# share an id (Google's is just the row number), and the names are in different
+# fields and rarely written exactly the same, so names get squashed down into a
+# compact key first ("Viber Messenger – Text & Call" -> "vibermessengertextandcall")
+# and joined on that with a hash join. Whatever doesn't match exactly can then be
+# matched fuzzily on character trigrams. To avoid comparing every app with every
+# other app, only apps sharing one of a name's rarest trigrams get compared
+# (n-gram blocking), and trigrams in too many names to tell anything apart are skipped
+import math, re, unicodedata
+
+from columnar import AppTable, get_column
+from instrument import instrument
+
+# Which fields hold what in each store
+GOOGLE_FIELDS = {"id": "id", "name": "app", "rating": "rating", "price": "price", "size": "size"}
+APPLE_FIELDS = {"id": "id", "name": "app_name", "rating": "user_rating", "price": "price", "size": "size"}
+
+# Trigrams that turn up in more names than this are too common to block on
+MAX_BLOCK_SIZE = 500
+
+RE_NOT_ALPHANUMERIC = re.compile(r"[\W_]+")
+
+
+# "Bloxels: Build, Play & Share" (quotes and all) -> "bloxelsbuildplayandshare"
+def name_key(name) -> str:
+    name = str(name)
+    if len(name) > 1 and name.startswith('"') and name.endswith('"'):
+        name = name[1:-1].replace('""', '"')
+    # split accented letters up so the accents can be dropped
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(char for char in name if not unicodedata.combining(char))
+    name = name.casefold().replace("&", "and")
+    return RE_NOT_ALPHANUMERIC.sub("", name)
+
+def trigrams(key: str) -> set:
+    key = f"^{key}$"
+    return {key[i:i + 3] for i in range(len(key) - 2)}
+
+def dice(first: set, second: set) -> float:
+    if not first or not second:
+        return 0.0
+    return 2 * len(first & second) / (len(first) + len(second))
+
+
+# Pairs up rows whose keys are exactly the same. Every right row with a key goes
+# into a dict, then the left rows look themselves up in it
+def hash_join(left_keys: list, right_keys: list) -> list:
+    buckets = {}
+    for row, key in enumerate(right_keys):
+        if key:
+            buckets.setdefault(key, []).append(row)
+
+    return [(left, right) for left, key in enumerate(left_keys) if key
+            for right in buckets.get(key, ())]
+
+
+# Pairs up left and right rows whose keys are similar enough (dice coefficient on
+# trigrams of at least threshold). Each row ends up in at most one pair, with the
+# best scoring pairs picked first.
+# Two names can only score threshold or more if they share at least
+# threshold / (2 - threshold) of the left name's trigrams, so it's enough to look
+# up the rarest few trigrams of each left name - any good match has to have one of them
+def fuzzy_join(left_keys: dict, right_keys: dict, threshold=0.8, max_block=MAX_BLOCK_SIZE) -> list:
+    right_grams = {row: trigrams(key) for row, key in right_keys.items() if key}
+    blocks = {}
+    for row, grams in right_grams.items():
+        for gram in grams:
+            blocks.setdefault(gram, []).append(row)
+
+    candidates = []
+    for left, key in left_keys.items():
+        if not key:
+            continue
+        grams = trigrams(key)
+        needed = math.ceil(threshold / (2 - threshold) * len(grams))
+        rarest = sorted((gram for gram in grams if gram in blocks), key=lambda gram: len(blocks[gram]))
+        if len(rarest) < needed:
+            continue
+
+        # names too much shorter or longer can't get there either
+        shortest = threshold / (2 - threshold) * len(grams)
+        longest = (2 - threshold) / threshold * len(grams)
+
+        compared = set()
+        for gram in rarest[:len(grams) - needed + 1]:
+            block = blocks[gram]
+            if len(block) > max_block:
+                break
+            for right in block:
+                if right in compared:
+                    continue
+                compared.add(right)
+                other = right_grams[right]
+                if not shortest <= len(other) <= longest:
+                    continue
+                score = dice(grams, other)
+                if score >= threshold:
+                    candidates.append((score, left, right))
+
+    pairs = []
+    used_left, used_right = set(), set()
+    for score, left, right in sorted(candidates, key=lambda x: (-x[0], x[1], x[2])):
+        if left in used_left or right in used_right:
+            continue
+        used_left.add(left)
+        used_right.add(right)
+        pairs.append((left, right, score))
+    return pairs
+
+
+# Joins the two stores on app name and gives back an AppTable with a row per matched
+# pair: both ids and names, how it was matched, and the rating, price and size from
+# each store side by side. fuzzy=False only keeps exact (key) matches
+@instrument(rows="result")
+def join_stores(google, apple, fuzzy=True, threshold=0.8,
+                google_fields=GOOGLE_FIELDS, apple_fields=APPLE_FIELDS) -> AppTable:
+    google_keys = [name_key(name) for name in get_column(google, google_fields["name"])]
+    apple_keys = [name_key(name) for name in get_column(apple, apple_fields["name"])]
+
+    matches = [(left, right, "exact", 1.0) for left, right in hash_join(google_keys, apple_keys)]
+
+    if fuzzy:
+        matched_left = {left for left, _, _, _ in matches}
+        matched_right = {right for _, right, _, _ in matches}
+        left_keys = {row: key for row, key in enumerate(google_keys) if row not in matched_left}
+        right_keys = {row: key for row, key in enumerate(apple_keys) if row not in matched_right}
+        matches += [(left, right, "fuzzy", round(score, 4))
+                    for left, right, score in fuzzy_join(left_keys, right_keys, threshold)]
+
+    matches.sort(key=lambda x: (x[0], x[1]))
+
+    fields = ("id", "name", "rating", "price", "size")
+    google_columns = {field: get_column(google, google_fields[field]) for field in fields}
+    apple_columns = {field: get_column(apple, apple_fields[field]) for field in fields}
+
+    headers = ["pair", "match", "score"]
+    headers += [f"google_{field}" for field in fields] + [f"apple_{field}" for field in fields]
+    rows = [[pair, how, score]
+            + [google_columns[field][left] for field in fields]
+            + [apple_columns[field][right] for field in fields]
+            for pair, (left, right, how, score) in enumerate(matches)]
+
+    return AppTable.from_rows(headers, rows, key="pair")
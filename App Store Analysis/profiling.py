@@ -1,11 +1,49 @@
-import cProfile, pstats
+import argparse, cProfile, pstats, tempfile
 from functions import *
+from instrument import span, summary, trace_memory, write_chrome_trace
+import analysis
 
-profile = os.path.join(DATA_FOLDER, "profile")
+# Kept out of the repo, it's only any use on the machine that made it
+profile = os.path.join(tempfile.gettempdir(), "app_store_profile")
+trace = os.path.join(tempfile.gettempdir(), "app_store_trace.json")
+
+# Loading both stores and the analysis, without the charts (which would only be
+# profiling matplotlib and waiting for the windows to be closed)
+def load_and_analyse():
+    google_play = load_save_data(PATH_TO_GOOGLE_PLAY_STORE, columnar=True)
+    app_store = load_save_data(PATH_TO_APP_STORE, columnar=True)
+    analysis.analyse(google_play, app_store)
 
 # Helps me to identify what was slowing down my code
-cProfile.run("load_save_data(PATH_TO_GOOGLE_PLAY_STORE)", profile)
-cProfile.run("from analysis import *", sort="cumulative")
+# (benchmark.py is better for seeing if something has got slower)
+def run_cprofile():
+    cProfile.runctx("load_and_analyse()", globals(), {}, profile)
+
+    p = pstats.Stats(profile)
+    p.sort_stats(pstats.SortKey.CUMULATIVE).print_stats()
+
+# The instrumentation in functions.py is always on, so this is just the analysis
+# without the charts and then what it recorded. Much less detail than cProfile, but
+# it runs at full speed
+def run_instrumented(memory=False):
+    if memory:
+        trace_memory()
+    with span("analysis"):
+        load_and_analyse()
+
+    print()
+    print(summary())
+    write_chrome_trace(trace)
+    print("Chrome trace written to", trace)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cprofile", action="store_true", help="run the loading and analysis under cProfile")
+    parser.add_argument("--memory", action="store_true", help="record peak memory too (slower)")
+    args = parser.parse_args()
 
-p = pstats.Stats(profile)
-p.sort_stats(pstats.SortKey.CUMULATIVE).print_stats()
+    if args.cprofile:
+        run_cprofile()
+    else:
+        run_instrumented(args.memory)
@@ -0,0 +1,197 @@
+# Progress and timing for loading the datasets. Replaces the old show_progress and
+# custom_thread pair, which polled a global flag (so two loads at once would stop
+# each other's dots) and always waited out one more 0.3s sleep after the work was done
+import sys, threading
+from contextlib import contextmanager
+from time import perf_counter
+
+
+# What a load got through and where the time went. The parser adds to rows and
+# bytes as it goes, and each stage (read, split, clean, dedupe, serialise...)
+# adds up how long it took
+class Timings:
+    def __init__(self, label=""):
+        self.label = label
+        self.stages = {}
+        self.rows = 0
+        self.bytes = 0
+
+    def add(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name: str):
+        started = perf_counter()
+        try:
+            yield self
+        finally:
+            self.add(name, perf_counter() - started)
+
+    # Adds another record's numbers into this one (like from a worker process)
+    def merge(self, other: "Timings"):
+        self.rows += other.rows
+        self.bytes += other.bytes
+        for stage, seconds in other.stages.items():
+            self.add(stage, seconds)
+
+    @property
+    def total(self) -> float:
+        return sum(self.stages.values())
+
+    # Plain dict so it can go straight into a log or json.dumps
+    def as_dict(self) -> dict:
+        return {"label": self.label, "rows": self.rows, "bytes": self.bytes,
+                "stages": {stage: round(seconds, 6) for stage, seconds in self.stages.items()},
+                "total": round(self.total, 6)}
+
+    def __str__(self):
+        stages = ", ".join(f"{stage} {seconds:.3f}s" for stage, seconds in self.stages.items())
+        return f"{self.label or 'load'}: {self.rows} rows, {self.bytes / 1e6:.2f} MB ({stages})"
+
+
+def format_rate(count: float, seconds: float, unit: str) -> str:
+    rate = count / seconds if seconds > 0 else 0
+    for prefix in ("", "k", "M", "G"):
+        if rate < 1000:
+            break
+        rate /= 1000
+    return f"{rate:.1f} {prefix}{unit}/s"
+
+
+# Shows "Generating..." with how fast the rows and bytes are going by, in a background
+# thread, until the with block is done. Stopping is done with an Event, so it stops
+# straight away rather than at the next tick, and each one has its own
+class Progress:
+    def __init__(self, label: str, timings: Timings = None, interval=0.3, stream=None):
+        self.label = label
+        self.timings = timings if timings is not None else Timings(label)
+        self.interval = interval
+        self.stream = stream or sys.stdout
+        # only bother with the dots if someone's watching
+        self._tty = getattr(self.stream, "isatty", lambda: False)()
+        self._done = threading.Event()
+        self._thread = None
+        self._started = None
+
+    def _line(self, dots: int) -> str:
+        elapsed = perf_counter() - self._started
+        line = self.label + "." * dots
+        if self.timings.rows:
+            line += (f" {self.timings.rows} rows ({format_rate(self.timings.rows, elapsed, 'rows')},"
+                     f" {format_rate(self.timings.bytes, elapsed, 'B')})")
+        return line
+
+    def _run(self):
+        dot = 0
+        while not self._done.wait(self.interval):
+            print("\r" + self._line(dot % 3 + 1) + "\033[K", end="", file=self.stream, flush=True)
+            dot += 1
+
+    def __enter__(self):
+        self._started = perf_counter()
+        self._done.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        if self._tty:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._done.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        line = self._line(0) + f" done in {perf_counter() - self._started:.2f}s"
+        print("\r" + line + "\033[K" if self._tty else line, file=self.stream, flush=True)
+        return False
+
+
+# Timings whose rows and bytes live in shared memory (a pair of slots in a
+# multiprocessing Array of longs), so a load going on in another process can be
+# watched from this one. Both sides make one over the same array and slot
+class SharedTimings(Timings):
+    def __init__(self, counters, slot: int, label=""):
+        self._counters = counters
+        self._slot = slot * 2
+        super().__init__(label)
+
+    @property
+    def rows(self) -> int:
+        return self._counters[self._slot]
+
+    @rows.setter
+    def rows(self, value: int):
+        self._counters[self._slot] = value
+
+    @property
+    def bytes(self) -> int:
+        return self._counters[self._slot + 1]
+
+    @bytes.setter
+    def bytes(self, value: int):
+        self._counters[self._slot + 1] = value
+
+
+# One line for several loads going at once (see load_many), like
+# "Loading: googleplaystore 2.1s 4100 rows (1.9 krows/s) | AppleStore done".
+# When a load finishes, its own line (and anything it printed) goes out above that.
+# Unlike Progress this isn't a with block, since the loads finish in their own threads
+class ProgressBoard:
+    def __init__(self, label="Loading", interval=0.3, stream=None):
+        self.label = label
+        self.interval = interval
+        self.stream = stream or sys.stdout
+        self._tty = getattr(self.stream, "isatty", lambda: False)()
+        # name: [timings, started, finished]
+        self._loads = {}
+        self._lock = threading.RLock()
+        self._done = threading.Event()
+        self._thread = None
+
+    def add(self, name: str, timings: Timings = None) -> Timings:
+        timings = timings if timings is not None else Timings(name)
+        with self._lock:
+            self._loads[name] = [timings, perf_counter(), None]
+        return timings
+
+    def _print(self, text: str):
+        print("\r\033[K" + text if self._tty else text, file=self.stream, flush=True)
+
+    def finish(self, name: str, output="", failed=False):
+        with self._lock:
+            load = self._loads[name]
+            load[2] = perf_counter()
+            line = f"{name} {'failed' if failed else 'done'} in {load[2] - load[1]:.2f}s"
+            self._print(output + line)
+            if self._tty and not self._done.is_set():
+                print(self._line(), end="", file=self.stream, flush=True)
+
+    def _line(self) -> str:
+        now = perf_counter()
+        parts = []
+        for name, (timings, started, finished) in self._loads.items():
+            if finished is not None:
+                parts.append(f"{name} done")
+                continue
+            part = f"{name} {now - started:.1f}s"
+            if timings.rows:
+                part += f" {timings.rows} rows ({format_rate(timings.rows, now - started, 'rows')})"
+            parts.append(part)
+        return f"{self.label}: " + " | ".join(parts)
+
+    def _run(self):
+        while not self._done.wait(self.interval):
+            with self._lock:
+                print("\r" + self._line() + "\033[K", end="", file=self.stream, flush=True)
+
+    def start(self):
+        self._done.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        if self._tty:
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._done.set()
+        if self._thread is not None and self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join()
+        if self._tty:
+            print("\r\033[K", end="", file=self.stream, flush=True)
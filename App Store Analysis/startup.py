@@ -0,0 +1,102 @@
+# How long each project's analysis script takes to import, worked out from
+# python -X importtime, so the cold start of a headless run can be kept an eye on.
+# Importing a script shouldn't load any data or anything heavy like pandas or
+# matplotlib, that all waits for main(). Each script gets imported in a fresh
+# interpreter a few times (the quickest one counts), and going over its budget is
+# a failure, the same as a regression in benchmark.py:
+#
+#   python startup.py
+#   python startup.py --top 15
+#   python startup.py "../Book Store Sales/analysis.py" --budget 50
+import argparse, os, re, subprocess, sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Milliseconds each script is allowed for its imports (not counting the interpreter
+# starting up), with some room for slower machines
+BUDGETS = {os.path.join("App Store Analysis", "analysis.py"): 75,
+           os.path.join("Book Store Sales", "analysis.py"): 75,
+           os.path.join("Analyse My Finances", "src", "analysis.py"): 75}
+
+# If any of these turn up, something's being imported up front that should wait
+HEAVY_PACKAGES = ("matplotlib", "pandas", "numpy", "seaborn", "statsmodels", "scipy", "sklearn")
+
+RE_IMPORT_TIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+# Every module the script imported, as (name, depth, self, cumulative) with the
+# times in seconds, from its quickest run. The script itself is the last one
+def import_times(script, repeat=3) -> list:
+    folder, file = os.path.split(os.path.abspath(script))
+    module = os.path.splitext(file)[0]
+
+    best = None
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                                cwd=folder, capture_output=True, text=True)
+        if result.returncode:
+            raise RuntimeError(f"importing {script} failed:\n{result.stderr[-2000:]}")
+
+        entries = []
+        for line in result.stderr.splitlines():
+            match = RE_IMPORT_TIME.match(line)
+            if match is None:
+                continue
+            own, cumulative, indent, name = match.groups()
+            depth = (len(indent) - 1) // 2
+            # anything before this was the interpreter starting up, or another top level import
+            if depth == 0 and name != module:
+                entries = []
+                continue
+            entries.append((name, depth, int(own) / 1e6, int(cumulative) / 1e6))
+            if depth == 0:
+                break
+
+        if best is None or entries[-1][3] < best[-1][3]:
+            best = entries
+    return best
+
+def heavy_imports(entries: list) -> list:
+    return sorted({name.split(".")[0] for name, *_ in entries} & set(HEAVY_PACKAGES))
+
+# Prints how long the script took and where it went, giving back whether it was in budget
+def report(script, budget: float, entries: list, top=8) -> bool:
+    total = entries[-1][3]
+    within = total * 1000 <= budget
+    print(f"{os.path.relpath(script, ROOT):<45} {total * 1000:7.1f} ms"
+          f" (budget {budget:.0f} ms){'' if within else '  <-- over budget'}")
+
+    # sorted by how long they took, so they're shown flat rather than as a tree -
+    # the slowest ones aren't necessarily inside each other
+    for name, depth, own, cumulative in sorted(entries[:-1], key=lambda entry: -entry[3])[:top]:
+        print(f"    {name:<40} {cumulative * 1000:7.1f} ms ({own * 1000:.1f} ms itself)")
+
+    heavy = heavy_imports(entries)
+    if heavy:
+        print(f"    imports {', '.join(heavy)} straight away")
+    return within
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time how long the analysis scripts take to import")
+    parser.add_argument("scripts", nargs="*", help="scripts to time (defaults to every one in BUDGETS)")
+    parser.add_argument("--budget", type=float, help="milliseconds allowed, instead of the ones in BUDGETS")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=8, help="how many of the slowest imports to show")
+    args = parser.parse_args(argv)
+
+    scripts = args.scripts or [os.path.join(ROOT, script) for script in BUDGETS]
+    over = []
+    for script in scripts:
+        budget = args.budget or BUDGETS.get(os.path.relpath(os.path.abspath(script), ROOT), 100)
+        if not report(script, budget, import_times(script, args.repeat), args.top):
+            over.append(script)
+
+    if over:
+        print(f"\n{len(over)} over budget")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+# Makes up store data shaped like the real Google Play and App Store CSVs, at
+# whatever size is needed for benchmarking. It has the same quirks the cleaning
+# has to deal with: quoted install counts ("10,000+"), sizes in M and k,
+# "Varies with device", "NaN" ratings, $ prices, quoted dates, names with commas
+# in them, names with CJK characters (which get filtered out) and duplicate apps
+import os, random, tempfile
+from datetime import date, timedelta
+
+SYNTHETIC_FOLDER = os.path.join(tempfile.gettempdir(), "app_store_synthetic")
+
+GOOGLE_HEADER = ("App,Category,Rating,Reviews,Size,Installs,Type,Price,Content Rating,"
+                 "Genres,Last Updated,Current Ver,Android Ver")
+APPLE_HEADER = ("id,app_name,size,currency,price,rating_count_tot,rating_count_ver,user_rating,"
+                "user_rating_ver,ver,cont_rating,prime_genre,sup_devices_num,ipadSc_urls_num,lang_num,vpp_lic")
+
+CATEGORIES = ["ART_AND_DESIGN", "BUSINESS", "COMMUNICATION", "EDUCATION", "ENTERTAINMENT",
+              "FAMILY", "FINANCE", "GAME", "HEALTH_AND_FITNESS", "LIFESTYLE", "MEDICAL",
+              "PHOTOGRAPHY", "PRODUCTIVITY", "SOCIAL", "SPORTS", "TOOLS", "TRAVEL_AND_LOCAL"]
+GENRES = ["Action", "Art & Design", "Arcade", "Casual", "Education", "Entertainment", "Puzzle",
+          "Pretend Play", "Simulation", "Sports", "Strategy", "Tools", "Travel & Local"]
+PRIME_GENRES = ["Games", "Entertainment", "Education", "Photo & Video", "Utilities",
+                "Health & Fitness", "Productivity", "Social Networking", "Lifestyle", "Music"]
+CONTENT_RATINGS = ["Everyone", "Teen", "Mature 17+", "Everyone 10+", "Adults only 18+"]
+INSTALLS = [0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000, 500000,
+            1000000, 5000000, 10000000, 50000000, 100000000, 500000000, 1000000000]
+WORDS = ["Photo", "Editor", "Candy", "Camera", "Puzzle", "Quest", "Hero", "Music", "Radio",
+         "Pro", "Lite", "Free", "Kids", "Draw", "Paint", "Farm", "Saga", "Racing", "Chat",
+         "Weather", "Fitness", "Coach", "Budget", "Notes", "Scanner", "Browser", "VPN"]
+CJK_WORDS = ["消消乐", "天天", "王者", "音乐"]
+MONTHS = ["January", "February", "March", "April", "May", "June", "July", "August",
+          "September", "October", "November", "December"]
+
+# Roughly how often each quirk turns up
+DUPLICATE_SHARE = 0.07
+CJK_SHARE = 0.02
+VARIES_SHARE = 0.05
+NAN_RATING_SHARE = 0.15
+
+
+def _name(rng: random.Random, number: int) -> str:
+    name = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 4))) + f" {number}"
+    if rng.random() < CJK_SHARE:
+        name += " " + rng.choice(CJK_WORDS)
+    # some names have commas in them, so they come quoted
+    if rng.random() < 0.05:
+        name = f'"{name}, the game"'
+    return name
+
+def _date(rng: random.Random) -> str:
+    day = date(2010, 1, 1) + timedelta(days=rng.randrange(3000))
+    return f'"{MONTHS[day.month - 1]} {day.day}, {day.year}"'
+
+def _version(rng: random.Random) -> str:
+    return ".".join(str(rng.randint(0, 12)) for _ in range(rng.randint(1, 3)))
+
+
+def google_row(rng: random.Random, number: int, names: list) -> str:
+    if names and rng.random() < DUPLICATE_SHARE:
+        name = rng.choice(names)
+    else:
+        name = _name(rng, number)
+        names.append(name)
+
+    installs = rng.choice(INSTALLS)
+    installs = f'"{installs:,}+"' if installs >= 1000 else f"{installs}+"
+    size = (f"{rng.randint(1, 99)}M" if rng.random() < 0.8 else f"{rng.randint(1, 999)}k")
+    version = _version(rng)
+    if rng.random() < VARIES_SHARE:
+        size = version = "Varies with device"
+    rating = "NaN" if rng.random() < NAN_RATING_SHARE else f"{rng.randint(10, 50) / 10}"
+    paid = rng.random() < 0.08
+    genres = rng.choice(GENRES) + (f";{rng.choice(GENRES)}" if rng.random() < 0.1 else "")
+
+    return ",".join([name, rng.choice(CATEGORIES), rating, str(rng.randint(0, 5000000)), size,
+                     installs, "Paid" if paid else "Free",
+                     f"${rng.randint(99, 2999) / 100}" if paid else "0",
+                     rng.choice(CONTENT_RATINGS), genres, _date(rng), version, "4.0.3 and up"])
+
+def apple_row(rng: random.Random, number: int, names: list) -> str:
+    # the first field is what duplicates are spotted by, and for Apple that's the id
+    if names and rng.random() < DUPLICATE_SHARE:
+        app_id = rng.choice(names)
+    else:
+        app_id = str(280000000 + number)
+        names.append(app_id)
+
+    return ",".join([app_id, _name(rng, number), str(rng.randint(1000000, 4000000000)), "USD",
+                     f"{rng.choice([0.0, 0.0, 0.0, 0.99, 1.99, 4.99])}",
+                     str(rng.randint(0, 3000000)), str(rng.randint(0, 50000)),
+                     f"{rng.randint(0, 10) / 2}", f"{rng.randint(0, 10) / 2}", _version(rng),
+                     rng.choice(["4+", "9+", "12+", "17+"]), rng.choice(PRIME_GENRES),
+                     str(rng.randint(9, 47)), str(rng.randint(0, 5)), str(rng.randint(0, 75)),
+                     str(rng.randint(0, 1))])
+
+
+# Writes a made up store CSV with rows rows (before filtering), and gives back its
+# path. Files are kept between runs, since the big ones take a while to make
+def synthetic_csv(store: str, rows: int, seed=0, folder=SYNTHETIC_FOLDER) -> str:
+    header, make_row = {"google": (GOOGLE_HEADER, google_row), "apple": (APPLE_HEADER, apple_row)}[store]
+    path = os.path.join(folder, f"{store}_{rows}_{seed}.csv")
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(folder, exist_ok=True)
+    rng = random.Random(f"{store}-{rows}-{seed}")
+    # Only the most recent names are kept to duplicate, so 10M rows doesn't need 10M names in memory
+    names = []
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        f.write(header + "\n")
+        for number in range(rows):
+            f.write(make_row(rng, number, names) + "\n")
+            if len(names) > 10000:
+                del names[:5000]
+    os.replace(temp_path, path)
+    return path
+
+
+# "10k" -> 10000, "1M" -> 1000000
+def parse_size(size: str) -> int:
+    units = {"k": 1000, "M": 1000000}
+    if size[-1:] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+    return int(size)
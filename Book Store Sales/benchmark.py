@@ -0,0 +1,163 @@
+# Times the cleaning on the bundled 2000 sales, and on a made up 10M row version
+# (the real rows picked at random, so it has the same books, states, mix of "NY"
+# and "New York", and share of blank reviews). The old row-by-row cleaning is kept
+# here to compare against, but it's only run on the smaller sizes, since on 10M rows
+# it needs more memory than most machines have
+#
+#   python benchmark.py
+#   python benchmark.py --rows 2000 100000 10000000
+import argparse, os, tempfile
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+from cleaning import *
+from cube import SalesCube
+from render import render_all, summary_charts
+
+DATA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Data", "book_reviews.csv")
+SYNTHETIC_FOLDER = os.path.join(tempfile.gettempdir(), "book_store_synthetic")
+
+LEGACY_MAX_ROWS = 1000000
+# The hot-deck loop goes through the whole column for every blank review (and falls
+# over if the very first review is blank), so it only gets the bundled file
+LEGACY_HOTDECK_MAX_ROWS = 2000
+
+VARIANTS = ("none", "mode", "hotdeck", "random", False)
+
+
+# How data_cleaning used to do it, dict comprehensions and all
+def legacy_data_cleaning(dataset, imputation=False):
+    _return = dataset.copy()
+
+    match imputation:
+        case "mode":
+            _return["review"] = _return["review"].fillna(_return["review"].mode().iloc[0])
+            _return["state"] = _return["state"].fillna(_return["state"].mode().iloc[0])
+
+        case "hotdeck":
+            def hot_deck_impute(col):
+                missing = col.isnull()
+                non_missing = ~missing
+                values = col[non_missing]
+                for i in missing[missing].index:
+                    j = np.abs(non_missing-i).argmin()
+                    col[i] = values[j]
+                return col
+
+            _return = _return.apply(hot_deck_impute)
+
+        case "random":
+            _return = _return.apply(lambda x: x.fillna(np.random.choice(x.dropna())))
+
+        case False:
+            _return = _return.dropna(how="any")
+
+        case _:
+            pass
+
+    _return["state"] = {x: US_STATE_NAME_CONVERT[y] if len(y) == 2 else y
+                        for x, y in _return["state"].items()}
+
+    _return["review"] = {key: REVIEW_TO_NUM[value]
+                        for key, value in _return["review"].items()}
+
+    return _return
+
+
+# The bundled sales picked at random (with the same seed, the same picks) up to rows
+# rows, written out as a CSV so reading it can be timed too. Kept between runs
+def synthetic_csv(rows: int, seed=0) -> str:
+    if rows == 2000:
+        return DATA_FILE
+    file = os.path.join(SYNTHETIC_FOLDER, f"book_reviews_{rows}_{seed}.csv")
+    if os.path.exists(file):
+        return file
+
+    os.makedirs(SYNTHETIC_FOLDER, exist_ok=True)
+    sales = pd.read_csv(DATA_FILE)
+    picks = np.random.default_rng(seed).integers(0, len(sales), rows)
+    sales.take(picks).to_csv(file + ".tmp", index=False)
+    os.replace(file + ".tmp", file)
+    return file
+
+
+def timed(func, *args, **kwargs):
+    started = perf_counter()
+    result = func(*args, **kwargs)
+    return result, perf_counter() - started
+
+def name(method) -> str:
+    return "dropna" if method is False else method
+
+def run(rows: int):
+    file = synthetic_csv(rows)
+    print(f"{rows:,} rows")
+    legacy = rows <= LEGACY_MAX_ROWS
+
+    if legacy:
+        raw, seconds = timed(pd.read_csv, file)
+        print(f"  read (text)         {seconds:8.3f}s")
+    sales, seconds = timed(read_reviews, file)
+    print(f"  read (categorical)  {seconds:8.3f}s")
+
+    base, normalise_seconds = timed(normalise, sales)
+    print(f"  normalise           {normalise_seconds:8.3f}s")
+    imputer, fit_seconds = timed(Imputer(IMPUTATION_GROUPS, RANDOM_SEED).fit, base)
+    print(f"  fit imputer         {fit_seconds:8.3f}s")
+    total_new = normalise_seconds + fit_seconds
+    variants = {}
+    for method in VARIANTS:
+        variants[method], new = timed(data_cleaning, base, method, imputer=imputer)
+        total_new += new
+        line = f"  {name(method):<8} new {new:8.3f}s"
+        if legacy and (method != "hotdeck" or rows <= LEGACY_HOTDECK_MAX_ROWS):
+            _, old = timed(legacy_data_cleaning, raw, method)
+            line += f"   old {old:8.3f}s   {old / new:6.1f}x"
+        print(line)
+
+    # the grouped strategies, only drawing on the same book in the same state
+    for method in ("group_mode", "group_mean", "group_random", "group_hotdeck"):
+        _, seconds = timed(data_cleaning, base, method, imputer=imputer)
+        print(f"  {method:<14} {seconds:8.3f}s")
+
+    # How much memory the cleaned datasets take between them
+    shared = sum(column.memory_usage(deep=True, index=False) for _, column in base.items())
+    separate = sum(variant.memory_usage(deep=True, index=False).sum() for variant in variants.values())
+    print(f"  all variants        {total_new:8.3f}s")
+    print(f"  memory: base {shared / 2 ** 20:.1f} MB, variants {separate / 2 ** 20:.1f} MB "
+          f"(counting shared columns in each)")
+
+
+# Renders count summary charts headlessly (the same few over and over), to see how
+# long a batch job's worth of charts takes
+def run_charts(count: int, workers=None):
+    base = normalise(read_reviews(DATA_FILE))
+    imputer = Imputer(IMPUTATION_GROUPS, RANDOM_SEED).fit(base)
+    methods = ("mode", "hotdeck", "random", "group_mode", "group_random")
+    cube = SalesCube.from_variants({method: data_cleaning(base, method, imputer=imputer) for method in methods})
+
+    folder = os.path.join(SYNTHETIC_FOLDER, "charts")
+    os.makedirs(folder, exist_ok=True)
+    jobs = [("summary", summary_charts(cube, methods[i % len(methods)]), f"Chart {i}",
+             os.path.join(folder, f"chart_{i}.png")) for i in range(count)]
+
+    times, seconds = timed(render_all, jobs, workers)
+    each = [render_seconds for _, render_seconds in times]
+    print(f"{count} charts in {seconds:.2f}s ({workers or os.cpu_count()} processes): "
+          f"first {each[0] * 1000:.0f} ms, median {np.median(each) * 1000:.0f} ms each")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[2000, 10000000])
+    parser.add_argument("--charts", type=int, help="render this many charts instead")
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args()
+
+    if args.charts:
+        run_charts(args.charts, args.workers)
+    else:
+        for rows in args.rows:
+            run(rows)
@@ -0,0 +1,171 @@
+import pandas as pd
+import numpy as np
+
+from imputation import STRATEGIES, Imputer
+
+# Turns out I don't even need 46 of these cos
+# there's only 4 states in the data :')
+# found online at https://gist.github.com/rogerallen/1583593
+US_STATE_NAME_CONVERT = {value: key for key, value in {
+    "Alabama": "AL",
+    "Alaska": "AK",
+    "Arizona": "AZ",
+    "Arkansas": "AR",
+    "California": "CA",
+    "Colorado": "CO",
+    "Connecticut": "CT",
+    "Delaware": "DE",
+    "Florida": "FL",
+    "Georgia": "GA",
+    "Hawaii": "HI",
+    "Idaho": "ID",
+    "Illinois": "IL",
+    "Indiana": "IN",
+    "Iowa": "IA",
+    "Kansas": "KS",
+    "Kentucky": "KY",
+    "Louisiana": "LA",
+    "Maine": "ME",
+    "Maryland": "MD",
+    "Massachusetts": "MA",
+    "Michigan": "MI",
+    "Minnesota": "MN",
+    "Mississippi": "MS",
+    "Missouri": "MO",
+    "Montana": "MT",
+    "Nebraska": "NE",
+    "Nevada": "NV",
+    "New Hampshire": "NH",
+    "New Jersey": "NJ",
+    "New Mexico": "NM",
+    "New York": "NY",
+    "North Carolina": "NC",
+    "North Dakota": "ND",
+    "Ohio": "OH",
+    "Oklahoma": "OK",
+    "Oregon": "OR",
+    "Pennsylvania": "PA",
+    "Rhode Island": "RI",
+    "South Carolina": "SC",
+    "South Dakota": "SD",
+    "Tennessee": "TN",
+    "Texas": "TX",
+    "Utah": "UT",
+    "Vermont": "VT",
+    "Virginia": "VA",
+    "Washington": "WA",
+    "West Virginia": "WV",
+    "Wisconsin": "WI",
+    "Wyoming": "WY",
+    "District of Columbia": "DC",
+    "American Samoa": "AS",
+    "Guam": "GU",
+    "Northern Mariana Islands": "MP",
+    "Puerto Rico": "PR",
+    "United States Minor Outlying Islands": "UM",
+    "U.S. Virgin Islands": "VI",
+}.items()}
+
+REVIEW_TO_NUM = {np.nan: 0,
+                 'Poor': 1,
+                 'Fair': 2,
+                 'Good': 3,
+                 'Great': 4,
+                 'Excellent': 5}
+
+REVIEW_TO_NUM_REVERSE = {value: key for key, value in REVIEW_TO_NUM.items()}
+
+# The reviews in order, so a review's category code + 1 is its number above
+REVIEWS = [review for review, num in sorted(REVIEW_TO_NUM.items(), key=lambda x: x[1]) if num]
+
+IMPUTATION_METHODS = list(STRATEGIES) + ["none"]
+
+# What the group_ imputation strategies group by
+IMPUTATION_GROUPS = ["book", "state"]
+
+# So the random imputation comes out the same every time the charts get drawn
+RANDOM_SEED = 0
+
+CATEGORY_COLUMNS = {"book": "category", "review": "category", "state": "category"}
+
+
+# Reads the sales straight into categoricals, so each of the few books, states and
+# reviews is stored once and every row is just a small code pointing at it
+def read_reviews(file) -> pd.DataFrame:
+    return pd.read_csv(file, dtype=CATEGORY_COLUMNS)
+
+def state_name(state: str) -> str:
+    return US_STATE_NAME_CONVERT[state] if len(state) == 2 else state
+
+# Converts a categorical's categories (not every row) with convert, merging any
+# that end up the same ("NY" and "New York"). The codes then just get looked up
+# in a small array, rather than going through a dict row by row
+def recode(column: pd.Series, convert) -> pd.Categorical:
+    column = column.astype("category")
+    names = [convert(category) for category in column.cat.categories]
+    categories = sorted(set(names))
+    position = {name: code for code, name in enumerate(categories)}
+    # the extra -1 on the end means missing values (code -1) stay missing
+    lookup = np.array([position[name] for name in names] + [-1], dtype=np.int32)
+    return pd.Categorical.from_codes(lookup[column.cat.codes.to_numpy()], categories)
+
+# The shared starting point every cleaned variant is built on: states as full names,
+# and book, state and review as categoricals (reviews ordered Poor -> Excellent).
+# Nothing is imputed or dropped yet, and frames that are already normalised are
+# handed straight back
+def normalise(dataset: pd.DataFrame) -> pd.DataFrame:
+    if isinstance(dataset["review"].dtype, pd.CategoricalDtype) and dataset["review"].cat.ordered:
+        return dataset
+
+    return pd.DataFrame({
+        "book": dataset["book"].astype("category"),
+        "review": dataset["review"].astype("category").cat.set_categories(REVIEWS, ordered=True),
+        "state": pd.Series(recode(dataset["state"], state_name), index=dataset.index),
+        "price": dataset["price"],
+    }, copy=False)
+
+
+# Only the columns that actually have gaps get touched, the rest are shared with base.
+# imputation is one method for every column or {column: method}. Pass in an Imputer
+# that's already been fit on base to save counting everything up again (it fills
+# the frame it was fit on, so one fit on anything else is refused)
+def impute(base: pd.DataFrame, imputation, groups=IMPUTATION_GROUPS, seed=None,
+           imputer: Imputer = None) -> pd.DataFrame:
+    if imputer is not None and imputer.frame is not base and \
+            (imputer.frame is None or not imputer.frame.equals(base)):
+        raise ValueError("imputer has to be fit on this dataset's normalise()d base")
+    if imputation is False:
+        # otherwise, drop NAs
+        return base.dropna(how="any")
+    if imputation in (None, "none"):
+        return base
+
+    imputer = imputer or Imputer(groups, seed).fit(base)
+    return imputer.fill(imputation)
+
+# Turns the reviews into numbers (REVIEW_TO_NUM, with blank reviews as 0) for the charts
+def finalise(dataset: pd.DataFrame) -> pd.DataFrame:
+    reviews = dataset["review"].cat.codes.astype(np.int8) + 1
+    return pd.DataFrame({"book": dataset["book"], "review": reviews,
+                         "state": dataset["state"], "price": dataset["price"]}, copy=False)
+
+
+# Added imputation function so the user can opt to either drop NA values,
+# or modally impute them. I could match imputation to a method.
+# dataset can be the raw sales or the normalised base from normalise(), and
+# either way it doesn't get changed or copied
+def data_cleaning(dataset: pd.DataFrame, imputation=False, groups=IMPUTATION_GROUPS, seed=None,
+                  imputer: Imputer = None) -> pd.DataFrame:
+    methods = imputation.values() if isinstance(imputation, dict) else [imputation]
+    if any(method and method not in IMPUTATION_METHODS for method in methods):
+        raise KeyError(f"Valid Imputation methods are: {IMPUTATION_METHODS}")
+
+    return finalise(impute(normalise(dataset), imputation, groups, seed, imputer))
+
+# Every variant from the one normalised base and one fitted Imputer, rather than
+# cleaning from scratch each time
+def clean_variants(dataset: pd.DataFrame, methods=("none", "mode", "hotdeck", "random", False),
+                   groups=IMPUTATION_GROUPS, seed=None) -> dict:
+    base = normalise(dataset)
+    imputer = Imputer(groups, seed).fit(base)
+    return {method: data_cleaning(base, method, imputer=imputer) for method in methods}
@@ -0,0 +1,110 @@
+# Everything the charts need, counted up in one pass per dataset variant: for each
+# (variant, state, book), how many sales there were with each review (0 being blank),
+# and what they added up to. Every chart is then just adding up a slice of this,
+# rather than grouping the whole dataset again for each one, and new sales can be
+# added on without counting the old ones again
+import numpy as np
+import pandas as pd
+
+from cleaning import REVIEW_TO_NUM
+
+# 0 (blank) up to 5 (Excellent)
+REVIEW_LEVELS = max(REVIEW_TO_NUM.values()) + 1
+
+# Which axis of a variant's (state, book) counts gets added up to group by each
+ADD_UP = {"state": 1, "book": 0}
+
+
+class SalesCube:
+    def __init__(self):
+        self.variants = []
+        self.states = []
+        self.books = []
+        # reviews[variant, state, book, review] is how many sales got that review
+        self.reviews = np.zeros((0, 0, 0, REVIEW_LEVELS), dtype=np.int64)
+        self.prices = np.zeros((0, 0, 0), dtype=np.float64)
+
+    @classmethod
+    def from_variants(cls, variants: dict) -> "SalesCube":
+        cube = cls()
+        for variant, frame in variants.items():
+            cube.add(variant, frame)
+        return cube
+
+    # Where each of names is along one side of the cube, adding on any it hasn't seen
+    def _positions(self, known: list, names) -> np.ndarray:
+        lookup = {name: position for position, name in enumerate(known)}
+        for name in names:
+            if name not in lookup:
+                lookup[name] = len(known)
+                known.append(name)
+        return np.array([lookup[name] for name in names], dtype=np.int64)
+
+    def _grow(self):
+        shape = (len(self.variants), len(self.states), len(self.books))
+        if shape != self.prices.shape:
+            pad = [(0, new - old) for new, old in zip(shape, self.prices.shape)]
+            self.prices = np.pad(self.prices, pad)
+            self.reviews = np.pad(self.reviews, pad + [(0, 0)])
+
+    # Counts frame (cleaned sales, reviews as numbers) into variant. Calling it again
+    # with new sales adds them on to what's already there. Sales with no state or
+    # book are left out, the same as grouping by them would
+    def add(self, variant: str, frame: pd.DataFrame):
+        states = frame["state"].astype("category")
+        books = frame["book"].astype("category")
+        state_codes, book_codes = states.cat.codes.to_numpy(), books.cat.codes.to_numpy()
+        # a missing category is code -1, which would otherwise index the last one
+        known = (state_codes >= 0) & (book_codes >= 0)
+        variant_index = self._positions(self.variants, [variant])[0]
+        state_index = self._positions(self.states, list(states.cat.categories))[state_codes[known]]
+        book_index = self._positions(self.books, list(books.cat.categories))[book_codes[known]]
+        self._grow()
+
+        cells = len(self.states) * len(self.books)
+        cell = state_index * len(self.books) + book_index
+        reviews = frame["review"].to_numpy()[known].astype(np.int64)
+        counts = np.bincount(cell * REVIEW_LEVELS + reviews, minlength=cells * REVIEW_LEVELS)
+        prices = np.bincount(cell, weights=frame["price"].to_numpy()[known], minlength=cells)
+
+        self.reviews[variant_index] += counts.reshape(len(self.states), len(self.books), REVIEW_LEVELS)
+        self.prices[variant_index] += prices.reshape(len(self.states), len(self.books))
+
+    # The review counts for one variant added up by "state" or "book"
+    def histogram(self, variant: str, by: str) -> pd.DataFrame:
+        reviews = self.reviews[self.variants.index(variant)]
+        counts = reviews.sum(axis=ADD_UP[by])
+        names = self.states if by == "state" else self.books
+        histogram = pd.DataFrame(counts, index=pd.Index(names, name=by))
+        return histogram.sort_index()
+
+    def counts(self, variant: str, by: str) -> pd.Series:
+        return self.histogram(variant, by).sum(axis=1)
+
+    def blanks(self, variant: str, by: str) -> pd.Series:
+        return self.histogram(variant, by)[0]
+
+    def mean_review(self, variant: str, by: str) -> pd.Series:
+        histogram = self.histogram(variant, by)
+        return histogram @ np.arange(REVIEW_LEVELS) / histogram.sum(axis=1)
+
+    # Most common review, the lowest one if there's a tie (like Series.mode)
+    def modal_review(self, variant: str, by: str) -> pd.Series:
+        histogram = self.histogram(variant, by)
+        return pd.Series(histogram.to_numpy().argmax(axis=1), index=histogram.index)
+
+    def total_price(self, variant: str, by: str) -> pd.Series:
+        prices = self.prices[self.variants.index(variant)].sum(axis=ADD_UP[by])
+        names = self.states if by == "state" else self.books
+        return pd.Series(prices, index=pd.Index(names, name=by)).sort_index()
+
+
+# New sales (read in with read_reviews) cleaned as a batch of their own and added on
+# to the cube. methods says how each variant was made, like {"mode": "mode",
+# "dropna": False}, and the imputation only draws on the new sales
+def append_sales(cube: SalesCube, sales: pd.DataFrame, methods: dict, seed=None):
+    from cleaning import clean_variants
+
+    cleaned = clean_variants(sales, list(methods.values()), seed=seed)
+    for variant, method in methods.items():
+        cube.add(variant, cleaned[method])
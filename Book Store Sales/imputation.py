@@ -0,0 +1,280 @@
+# Filling in missing values. Imputer (at the bottom) counts up everything the
+# strategies need in one go and can then fill a frame in any mix of ways.
+# Hot-deck imputation: every missing value gets filled in with the value from a
+# "donor", a row that isn't missing. Either the nearest row that isn't missing
+# (ties go to the row before), or a random one. Donors can be kept to the same
+# group, so a blank review for "R Made Easy" in Texas is only ever filled in from
+# other reviews of "R Made Easy" in Texas.
+# The old version went through the whole column for every missing value. This
+# sorts the rows by group once, then finds every gap's neighbours with one
+# searchsorted, so tens of millions of rows take seconds
+import numpy as np
+import pandas as pd
+
+NO_DONOR = -1
+
+
+# One code per row saying which group it's in, from one or more columns (categorical
+# codes get combined arithmetically, anything else goes through groupby)
+def group_codes(frame: pd.DataFrame, columns) -> np.ndarray:
+    columns = [columns] if isinstance(columns, str) else list(columns)
+    codes = np.zeros(len(frame), dtype=np.int64)
+    for name in columns:
+        column = frame[name]
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            # + 1 so missing values (code -1) get a group of their own
+            codes = codes * (len(column.cat.categories) + 1) + column.cat.codes.to_numpy() + 1
+        else:
+            codes = codes * (column.nunique(dropna=False) + 1) + \
+                column.groupby(column, dropna=False, sort=False).ngroup().to_numpy()
+    return codes
+
+
+# The rows in group order (keeping their order within each group) and the key used to
+# search them: group * rows + row, so rows in different groups are never next to each other
+def _sort_by_group(groups, rows: int) -> tuple:
+    if groups is None:
+        order = np.arange(rows)
+        return order, order
+    groups = np.asarray(groups)
+    # numpy's stable sort is a radix sort for 16 bit ints, much quicker than on int64
+    if len(groups) and groups.min() >= 0 and groups.max() < 1 << 16:
+        groups = groups.astype(np.uint16)
+    order = np.argsort(groups, kind="stable")
+    return order, groups[order].astype(np.int64) * rows + order
+
+# For every missing row, the row of the nearest donor in the same group, or NO_DONOR
+# if the group has no donors at all. Gives back (missing rows, donor rows)
+def nearest_donors(missing: np.ndarray, groups=None) -> tuple:
+    rows = len(missing)
+    order, keys = _sort_by_group(groups, rows)
+    gaps = missing[order]
+    donor_keys, donor_rows = keys[~gaps], order[~gaps]
+    gap_keys, gap_rows = keys[gaps], order[gaps]
+
+    found = np.full(len(gap_rows), NO_DONOR, dtype=np.int64)
+    if len(donor_keys) and len(gap_keys):
+        after = np.searchsorted(donor_keys, gap_keys)
+        before = after - 1
+        gap_group = gap_keys // rows
+        # neighbours off either end, or in another group, don't count
+        before_ok = (before >= 0) & (donor_keys[np.maximum(before, 0)] // rows == gap_group)
+        after_ok = (after < len(donor_keys)) & \
+            (donor_keys[np.minimum(after, len(donor_keys) - 1)] // rows == gap_group)
+
+        far = np.iinfo(np.int64).max
+        before_distance = np.where(before_ok, gap_keys - donor_keys[np.maximum(before, 0)], far)
+        after_distance = np.where(after_ok, donor_keys[np.minimum(after, len(donor_keys) - 1)] - gap_keys, far)
+        chosen = np.where(after_distance < before_distance, after, before)
+        has_donor = before_ok | after_ok
+        found[has_donor] = donor_rows[chosen[has_donor]]
+
+    return gap_rows, found
+
+# Same as nearest_donors, but each missing row gets a random donor from its group
+def random_donors(missing: np.ndarray, groups=None, rng: np.random.Generator = None) -> tuple:
+    rng = rng if rng is not None else np.random.default_rng()
+    rows = len(missing)
+    order, keys = _sort_by_group(groups, rows)
+    gaps = missing[order]
+    donor_groups, donor_rows = keys[~gaps] // rows, order[~gaps]
+    gap_groups, gap_rows = keys[gaps] // rows, order[gaps]
+
+    # every group's donors sit next to each other, so it's just picking a spot in
+    # between where the group starts and ends
+    start = np.searchsorted(donor_groups, gap_groups, "left")
+    count = np.searchsorted(donor_groups, gap_groups, "right") - start
+    pick = start + (rng.random(len(gap_rows)) * count).astype(np.int64)
+
+    found = np.full(len(gap_rows), NO_DONOR, dtype=np.int64)
+    has_donor = count > 0
+    found[has_donor] = donor_rows[pick[has_donor]]
+    return gap_rows, found
+
+
+# Fills in column's missing values from donors. groups is one code per row (see
+# group_codes) to keep donors within a group, and with fallback any row whose group
+# has no donors gets one from the whole column instead. random=True picks a random
+# donor (from rng, so a seeded Generator gives the same fill every time) rather than
+# the nearest one
+def hot_deck(column: pd.Series, groups=None, random=False, rng: np.random.Generator = None,
+             fallback=True) -> pd.Series:
+    categorical = isinstance(column.dtype, pd.CategoricalDtype)
+    values = column.cat.codes.to_numpy() if categorical else column.to_numpy()
+    missing = column.isna().to_numpy()
+    if not missing.any():
+        return column
+
+    find = (lambda missing, groups: random_donors(missing, groups, rng)) if random else nearest_donors
+    donor_of = np.full(len(values), NO_DONOR, dtype=np.int64)
+    gap_rows, donors = find(missing, groups)
+    donor_of[gap_rows] = donors
+    if fallback and groups is not None and (donors == NO_DONOR).any():
+        gap_rows, donors = find(missing, None)
+        left_over = donor_of[gap_rows] == NO_DONOR
+        donor_of[gap_rows[left_over]] = donors[left_over]
+
+    filled = values.copy()
+    gaps = np.flatnonzero(missing & (donor_of != NO_DONOR))
+    filled[gaps] = values[donor_of[gaps]]
+
+    if categorical:
+        filled = pd.Categorical.from_codes(filled, dtype=column.dtype)
+    return pd.Series(filled, index=column.index, name=column.name)
+
+
+STRATEGIES = ("mode", "mean", "random", "hotdeck",
+              "group_mode", "group_mean", "group_random", "group_hotdeck")
+
+
+# group_codes can be any size, this squashes them down to 0, 1, 2... so they can
+# index arrays. Gives back (group of each row, how many groups)
+def dense_groups(codes: np.ndarray) -> tuple:
+    used = np.bincount(codes) > 0
+    lookup = np.cumsum(used) - 1
+    return lookup[codes], int(used.sum())
+
+
+# What's needed to fill in one column, all counted up in one go: each value as a
+# code (categories for categoricals, factorized otherwise), and how many times each
+# code turns up in each group
+class ColumnStats:
+    def __init__(self, column: pd.Series, groups: np.ndarray, group_count: int):
+        self.column = column
+        self.categorical = isinstance(column.dtype, pd.CategoricalDtype)
+        if self.categorical:
+            self.codes = column.cat.codes.to_numpy()
+            self.values = column.cat.categories
+        else:
+            self.codes, self.values = pd.factorize(column)
+        self.missing = self.codes < 0
+
+        size = len(self.values)
+        valid = ~self.missing
+        flat = groups[valid].astype(np.int64) * size + self.codes[valid]
+        self.counts = np.bincount(flat, minlength=group_count * size).reshape(group_count, size)
+        self.overall = self.counts.sum(0)
+
+    # What the values count as when averaging them: ordered categories by where they
+    # come in the order (Poor = 0 ... Excellent = 4), numbers as themselves
+    def numbers(self) -> np.ndarray:
+        if self.categorical:
+            if not self.column.cat.ordered:
+                raise ValueError(f"{self.column.name} has no order, so it can't be averaged")
+            return np.arange(len(self.values), dtype=np.float64)
+        if not pd.api.types.is_numeric_dtype(self.column.dtype):
+            raise ValueError(f"{self.column.name} isn't numbers, so it can't be averaged")
+        return np.asarray(self.values, dtype=np.float64)
+
+    # Puts fill (codes, one per gap) into the gaps and builds the column back up
+    def rebuild(self, gaps: np.ndarray, fill: np.ndarray) -> pd.Series:
+        codes = self.codes.copy()
+        codes[gaps] = fill
+        if self.categorical:
+            values = pd.Categorical.from_codes(codes, dtype=self.column.dtype)
+        else:
+            values = self.values.take(codes, allow_fill=True)
+        return pd.Series(values, index=self.column.index, name=self.column.name)
+
+
+# Fits the statistics every strategy needs once, then hands out as many differently
+# filled versions of the same frame as needed, each sharing the columns it didn't fill:
+#
+#   imputer = Imputer(groups=["book", "state"], seed=0).fit(sales)
+#   by_mode = imputer.fill("mode")
+#   mixed = imputer.fill({"review": "group_hotdeck", "state": "mode"})
+#
+# Strategies are mode, mean, random (drawn from how often each value turns up) and
+# hotdeck (the nearest row's value), each over the whole column, or with group_ in
+# front only within the row's group (falling back to the whole column for groups
+# with nothing to go on). With a seed, the same strategy always fills the same way
+class Imputer:
+    def __init__(self, groups=None, seed=None):
+        self.groups = groups
+        self.seed = seed
+        self.frame = None
+        self.stats = {}
+
+    def fit(self, frame: pd.DataFrame) -> "Imputer":
+        self.frame = frame
+        if self.groups:
+            self.group_ids, self.group_count = dense_groups(group_codes(frame, self.groups))
+        else:
+            self.group_ids, self.group_count = np.zeros(len(frame), dtype=np.int64), 1
+        self.stats = {name: ColumnStats(column, self.group_ids, self.group_count)
+                      for name, column in frame.items() if column.hasnans}
+        return self
+
+    def _rng(self, name: str, strategy: str) -> np.random.Generator:
+        if self.seed is None:
+            return np.random.default_rng()
+        return np.random.default_rng([self.seed, list(self.frame.columns).index(name),
+                                      STRATEGIES.index(strategy)])
+
+    # strategy is one for every column with gaps, or {column: strategy}
+    def fill(self, strategy) -> pd.DataFrame:
+        if self.frame is None:
+            raise ValueError("Imputer has to be fit before it can fill anything")
+        strategies = strategy if isinstance(strategy, dict) else dict.fromkeys(self.stats, strategy)
+
+        columns = dict(self.frame.items())
+        for name, how in strategies.items():
+            if how in (None, "none") or name not in self.stats:
+                continue
+            if how not in STRATEGIES:
+                raise KeyError(f"Valid imputation strategies are: {list(STRATEGIES)}")
+            columns[name] = self.fill_column(name, how)
+        return pd.DataFrame(columns, copy=False)
+
+    def fill_column(self, name: str, strategy: str) -> pd.Series:
+        stats = self.stats[name]
+        if not stats.overall.any():
+            # nothing to fill it in from
+            return stats.column
+        grouped = strategy.startswith("group_")
+        how = strategy[len("group_"):] if grouped else strategy
+        gaps = np.flatnonzero(stats.missing)
+        gap_groups = self.group_ids[gaps] if grouped else np.zeros(len(gaps), dtype=np.int64)
+        counts = stats.counts if grouped else stats.overall[None, :]
+
+        if how == "hotdeck":
+            return hot_deck(stats.column, self.group_ids if grouped else None)
+
+        # groups with nothing in them get the whole column's counts instead
+        empty = counts.sum(1) == 0
+        if empty.any():
+            counts = counts.copy()
+            counts[empty] = stats.overall
+
+        if how == "mode":
+            fill = counts.argmax(1)[gap_groups]
+        elif how == "random":
+            fill = self._draw(counts, gap_groups, self._rng(name, strategy))
+        else:
+            means = counts @ stats.numbers() / counts.sum(1)
+            if not stats.categorical:
+                values = stats.column.to_numpy(dtype=np.float64, copy=True)
+                values[gaps] = means[gap_groups]
+                return pd.Series(values, index=stats.column.index, name=name)
+            # the nearest category to the average
+            fill = np.rint(means).astype(np.int64)[gap_groups]
+        return stats.rebuild(gaps, fill)
+
+    # One draw per gap from its group's counts: all the groups' counts are laid end to
+    # end and added up, so a random point in a group's stretch lands on each value as
+    # often as it turns up
+    @staticmethod
+    def _draw(counts: np.ndarray, gap_groups: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        size = counts.shape[1]
+        totals = counts.sum(1)
+        cumulative = counts.ravel().cumsum()
+        starts = cumulative[size - 1::size] - totals
+        points = starts[gap_groups] + rng.random(len(gap_groups)) * totals[gap_groups]
+        picks = np.searchsorted(cumulative, points, side="right")
+        # in case rounding pushes a point onto the very end of its stretch
+        picks = np.minimum(picks, (gap_groups + 1) * size - 1)
+        return picks - gap_groups * size
+
+    # Several fills from the same fit, like {"mode": "mode", "hotdeck": "hotdeck"}
+    def variants(self, strategies: dict) -> dict:
+        return {name: self.fill(strategy) for name, strategy in strategies.items()}
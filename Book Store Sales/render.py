@@ -0,0 +1,170 @@
+# Drawing the Book Store charts, either on screen (analysis.py) or straight to PNGs
+# without ever opening a window, so the charts can be made by a batch job on a
+# machine with no screen. Headless charts get drawn on plain Figures (so the Agg
+# renderer, not pyplot), spread across processes, and each process keeps the
+# figure for each kind of chart and just swaps the numbers in, rather than
+# building all the axes, titles and ticks again for every chart
+import os
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+from cleaning import REVIEW_TO_NUM
+
+MOSAIC = '''
+ABC
+DDD
+'''
+
+REVIEW_LABELS = [""] + list(REVIEW_TO_NUM.keys())[1:]
+
+# About the size of a maximised window
+FIGSIZE = (19.2, 10.8)
+
+# zlib's quickest setting. Charts are mostly flat colour so the files only come out a
+# little bigger, but the PNG encoding takes about half as long
+PNG_OPTIONS = {"compress_level": 1}
+
+
+# What each chart needs out of the cube. Only a few numbers, so it's cheap to hand
+# over to another process
+def blank_charts(cube, variant="raw") -> dict:
+    return {"by_state": cube.blanks(variant, "state"), "by_book": cube.blanks(variant, "book")}
+
+def summary_charts(cube, variant: str) -> dict:
+    return {"modal": cube.modal_review(variant, "state"),
+            "mean": cube.mean_review(variant, "state"),
+            "sales": cube.total_price(variant, "book"),
+            "states": cube.counts(variant, "state").sort_values(ascending=False)}
+
+
+def _set_heights(bars, ax, heights):
+    for bar, height in zip(bars, heights):
+        bar.set_height(height)
+    ax.relim()
+    ax.autoscale_view()
+
+
+# Number of blank reviews by state and by book, for the raw dataset
+class BlankTemplate:
+    def __init__(self, figure, data: dict):
+        self.figure = figure
+        self.axs = figure.subplots(2, 1)
+
+        self.state_bars = self.axs[0].bar(data["by_state"].index, [0] * len(data["by_state"]))
+        self.axs[0].set_title("Number of blank reviews by state", color="r")
+
+        self.book_bars = self.axs[1].bar(data["by_book"].index, [0] * len(data["by_book"]))
+        self.axs[1].set_title("Number of blank reviews by book", color="r")
+
+        figure.suptitle("Number of omitted reviews by state or book", weight="bold")
+
+    def fill(self, data: dict, title=None):
+        _set_heights(self.state_bars, self.axs[0], data["by_state"].values)
+        _set_heights(self.book_bars, self.axs[1], data["by_book"].values)
+
+
+# The modal and mean review by state, books sold by state and total sales of each book
+class SummaryTemplate:
+    def __init__(self, figure, data: dict):
+        from matplotlib.ticker import StrMethodFormatter
+
+        self.figure = figure
+        # This mosaic is exactly what I needed, beautiful, succinct and tidy
+        # Also works as a nested list if you wanted proper names
+        self.axs = figure.subplot_mosaic(MOSAIC)
+        axs = self.axs
+
+        # Putting bar and pie charts onto a mosaic figure
+        self.modal_bars = axs["A"].bar(data["modal"].index, [0] * len(data["modal"]))
+        axs["A"].set_title("Modal review grouped by state", color="r")
+
+        self.mean_bars = axs["B"].bar(data["mean"].index, [0] * len(data["mean"]))
+        axs["B"].set_title("Mean review grouped by state", color="r")
+
+        for ax in (axs["A"], axs["B"]):
+            ax.set_yticks(list(range(0, 6)))
+            ax.set_yticklabels(REVIEW_LABELS)
+            ax.set_ylim(0, 5.5)
+
+        self.sales_bars = axs["D"].bar(data["sales"].index, [0] * len(data["sales"]))
+        axs["D"].yaxis.set_major_formatter(StrMethodFormatter("${x:,.0f}"))
+        axs["D"].tick_params(axis="both", labelrotation=15)
+        axs["D"].set_title("Total sales of each book", color="r")
+
+        self.title = figure.suptitle("", y=1, weight="bold", size="16", stretch="expanded")
+
+    def fill(self, data: dict, title=""):
+        for bars, values in ((self.modal_bars, data["modal"]), (self.mean_bars, data["mean"])):
+            for bar, height in zip(bars, values.values):
+                bar.set_height(height)
+        _set_heights(self.sales_bars, self.axs["D"], data["sales"].values)
+
+        # wedges can't be resized like bars, so the pie gets drawn again
+        self.axs["C"].clear()
+        self.axs["C"].pie(data["states"], labels=data["states"].index)
+        self.axs["C"].set_title("Number of books by state", color="r")
+
+        self.title.set_text(title)
+
+
+TEMPLATES = {"blanks": BlankTemplate, "summary": SummaryTemplate}
+
+# Draws a chart onto figure (like plt.figure() to show it on screen)
+def draw(kind: str, data: dict, title="", figure=None):
+    if figure is None:
+        from matplotlib.figure import Figure
+        figure = Figure(figsize=FIGSIZE)
+    template = TEMPLATES[kind](figure, data)
+    template.fill(data, title)
+    return template
+
+
+# Each worker process's templates, by what kind of chart they are and what's along
+# the bottom of them (so a chart with another state in it gets its own)
+_templates = {}
+
+def _template(kind: str, data: dict):
+    key = (kind,) + tuple(tuple(series.index) for series in data.values())
+    if key not in _templates:
+        from matplotlib.figure import Figure
+        _templates[key] = TEMPLATES[kind](Figure(figsize=FIGSIZE), data)
+    return _templates[key]
+
+# Draws and saves one chart, giving back where it went and how long it took
+def render(job: tuple) -> tuple:
+    kind, data, title, file = job
+    started = perf_counter()
+    template = _template(kind, data)
+    template.fill(data, title)
+    template.figure.savefig(file, pil_kwargs=PNG_OPTIONS)
+    return file, perf_counter() - started
+
+
+# Renders every (kind, data, title, file) job, across workers processes (all the
+# CPUs by default, 1 to do it all in this process), and gives back how long each took
+def render_all(jobs: list, workers=None) -> list:
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(jobs) < 2:
+        return [render(job) for job in jobs]
+
+    # a few jobs at a time, so the charts don't each have to be sent over on their own
+    chunk = max(1, len(jobs) // (workers * 4))
+    with ProcessPoolExecutor(workers) as executor:
+        return list(executor.map(render, jobs, chunksize=chunk))
+
+# Every variant's chart as a PNG in folder. variants is {variant: title}, and the
+# raw one gets the blank review chart instead
+def render_report(cube, variants: dict, folder, workers=None) -> list:
+    os.makedirs(folder, exist_ok=True)
+    jobs = []
+    for variant, title in variants.items():
+        if variant == "raw":
+            jobs.append(("blanks", blank_charts(cube, variant), title, os.path.join(folder, f"{variant}_blanks.png")))
+        else:
+            jobs.append(("summary", summary_charts(cube, variant), title, os.path.join(folder, f"{variant}_summary.png")))
+    return render_all(jobs, workers)
+
+def print_render_times(times: list):
+    for file, seconds in times:
+        print(f"{os.path.basename(file):<40} {seconds * 1000:8.1f} ms")
+    print(f"{len(times)} charts, {sum(seconds for _, seconds in times):.2f}s rendering")